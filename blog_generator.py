@@ -5,9 +5,12 @@ YouTube Blog Generator - CLI Interface
 Usage:
     python blog_generator.py "https://www.youtube.com/watch?v=VIDEO_ID"
     python blog_generator.py "https://www.youtube.com/watch?v=VIDEO_ID" --output custom_blog.md
+    python blog_generator.py "https://www.youtube.com/watch?v=VIDEO_ID" --batch
+    python blog_generator.py "https://www.youtube.com/watch?v=VIDEO_ID" --combined
 """
 
 import asyncio
+import logging
 import sys
 import argparse
 from pathlib import Path
@@ -27,6 +30,18 @@ async def main():
         default="blog_post.md",
         help="Output file path (default: blog_post.md)"
     )
+    parser.add_argument(
+        "--combined",
+        action="store_true",
+        help="Draft every section in one JSON-mode request, falling back to "
+             "per-section workers only where needed (default: COMBINED_GENERATION setting)"
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Queue the sections through the OpenAI Batch API: half price, but "
+             "can take up to 24h (offline runs only)"
+    )
     parser.add_argument(
         "--verbose", "-v",
         action="store_true", 
@@ -34,20 +49,28 @@ async def main():
     )
     
     args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="[%(name)s] %(message)s",
+    )
     
     orchestrator = BlogOrchestrator()
     
     try:
         print(f"🎬 Processing: {args.url}")
         
-        blog_data = await orchestrator.generate_blog_post(args.url)
+        if args.batch:
+            print("⏳ Batch mode: results can take up to 24 hours")
+        blog_data = await orchestrator.generate_blog_post(
+            args.url, combined=True if args.combined else None, batch=args.batch
+        )
         
         output_path = Path(args.output)
-        await orchestrator.save_blog_post(blog_data, output_path)
+        output_path.write_text(blog_data["content"], encoding="utf-8")
         
         print(f"✅ Blog post generated successfully!")
         print(f"📄 Output: {output_path.absolute()}")
-        print(f"📊 Word count: ~{len(blog_data['content'].split())}")
+        print(f"📊 Word count: ~{blog_data['stats']['word_count']}")
         
         if args.verbose:
             print("\n--- PREVIEW ---")
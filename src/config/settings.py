@@ -5,9 +5,16 @@ import os
 
 load_dotenv(Path(__file__).resolve().parents[1] / '.env')
 
+# Repository root; on-disk caches live under it rather than the working directory
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
 @lru_cache
 def get_settings():
     return {
         "openai_api_key": os.getenv("OPENAI_API_KEY"),
         "openai_model":  os.getenv("OPENAI_MODEL", "gpt-5-mini"),
+        "cache_dir": Path(os.getenv("CACHE_DIR") or PROJECT_ROOT / ".cache"),
+        "semantic_cache": os.getenv("SEMANTIC_CACHE", "false").lower() in ("1", "true", "yes"),
+        # Draft every section in one JSON-mode request first (fewer round trips)
+        "combined_generation": os.getenv("COMBINED_GENERATION", "false").lower() in ("1", "true", "yes"),
     }
@@ -1,6 +1,7 @@
 from __future__ import annotations
 import asyncio
-from typing import Dict, List
+import logging
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Union
 import re
 import time
 import traceback
@@ -8,9 +9,20 @@ import traceback
 from workers.implementations import (
     TitleWorker, IntroWorker, ContextWorker, KeyPointsWorker,
     QuotesWorker, SummaryWorker, WhatThisMeansWorker, ConclusionWorker,
-    SEOWorker, TagsWorker, chunk_text
+    SEOWorker, TagsWorker, CombinedWorker, GenerationContext, count_words, embed_text, first_words,
+    submit_batch, wait_for_batch, prewarm
 )
+from utils import response_cache
 from utils.youtube_processor import fetch_transcript
+from config.settings import get_settings
+
+log = logging.getLogger(__name__)
+
+__all__ = ["BlogOrchestrator", "ORCH_VERSION"]
+
+# Bump whenever prompts, routing or assembly change; persisted posts written by
+# another version are then ignored instead of served.
+ORCH_VERSION = "1"
 
 BANNED_PHRASES = [
     "this video provides valuable insights",
@@ -21,11 +33,42 @@ BANNED_PHRASES = [
     "deep dive",
 ]
 
+# Minimum words per section (to avoid generic, too-short outputs)
+MIN_WORDS = {
+    "title": 1,
+    "intro": 150,
+    "context": 120,
+    "key_points_1": 220,
+    "key_points_2": 220,
+    "quotes": 120,
+    "summary": 150,
+    "what_this_means_for_you": 150,
+    "conclusion": 120,
+    "seo": 1,
+    "tags": 1,
+}
+
+# Sections in the order they appear in the post (SEO is metadata, not body),
+# and the transition line placed before a section when it has content
+POST_ORDER = (
+    "title", "intro", "context", "key_points_1", "key_points_2", "quotes",
+    "summary", "what_this_means_for_you", "conclusion", "tags",
+)
+TRANSITIONS = {
+    "key_points_1": "Here’s where it gets useful…",
+    "quotes": "Let’s pull a couple of lines that stuck with me…",
+    "summary": "So what’s the big picture?",
+    "what_this_means_for_you": "Let’s make this practical.",
+    "conclusion": "One honest caveat before we wrap up…",
+}
+
+# Below this share of non-empty sections the post is flagged as emergency_mode
+MIN_SUCCESS_RATIO = 0.5
+
 def is_low_quality(text: str, min_words: int) -> bool:
     if not text or len(text.strip()) == 0:
         return True
-    words = len(text.strip().split())
-    if words < min_words:
+    if count_words(text, min_words) < min_words:
         return True
     lower = text.lower()
     if any(p in lower for p in BANNED_PHRASES):
@@ -59,6 +102,7 @@ class BlogOrchestrator:
             "seo": SEOWorker(),
             "tags": TagsWorker(),
         }
+        self.combined_worker = CombinedWorker()
 
     def _enhance_if_thin(self, transcript: str, youtube_url: str) -> str:
         if not transcript or len(transcript.strip()) < 200:
@@ -74,19 +118,33 @@ class BlogOrchestrator:
             return (transcript or "") + "\n\n" + enhanced
         return transcript
 
-    async def _run_with_retry(self, worker, transcript: str, min_words: int, task_hint: str = "") -> str:
+    async def _stream_into(self, worker, transcript: Union[str, GenerationContext],
+                           sink: "asyncio.Queue[Optional[str]]") -> str:
+        """Run a worker through its streaming path, passing every piece to sink; returns the whole text."""
+        parts: List[str] = []
+        async for piece in worker.generate_stream(transcript):
+            parts.append(piece)
+            sink.put_nowait(piece)
+        return "".join(parts).strip()
+
+    async def _run_with_retry(self, worker, transcript: Union[str, GenerationContext], min_words: int,
+                              task_hint: str = "", sink: Optional["asyncio.Queue[Optional[str]]"] = None) -> str:
         """
         Runs a worker once; if low quality, attempts one corrective retry by appending
-        corrective instruction to the system message via a hint string.
+        corrective instruction to the system message via a hint string. With a
+        sink, the first attempt is streamed into it; the retry is not streamed.
         """
         try:
-            out = await worker.generate(transcript)
+            if sink is not None:
+                out = await self._stream_into(worker, transcript, sink)
+            else:
+                out = await worker.generate(transcript)
             if not is_low_quality(out, min_words):
                 return out
             # Retry once with stronger instruction if worker supports indirect task usage
             # For our workers, we use the same internal prompt; we can nudge via transcript suffix
             # without modifying worker code.
-            augmented_transcript = transcript + (
+            augmented_transcript = GenerationContext.of(transcript).text + (
                 "\n\n[Writer Note] The previous draft was too generic. "
                 "Make it concrete, use one example, and add one practical suggestion. "
                 "Avoid banned phrases."
@@ -94,136 +152,275 @@ class BlogOrchestrator:
             out2 = await worker.generate(augmented_transcript)
             return out2
         except Exception as e:
-            print(f"[Retry] Worker {worker.name} failed: {e}")
+            log.warning("Worker %s failed: %s", worker.name, e)
             return ""  # will be replaced by fallback in assembly
 
+    async def _embed_for_cache(self, transcript: GenerationContext):
+        """Embed the transcript once for the semantic cache; None when disabled or failing."""
+        if not get_settings()["semantic_cache"]:
+            return None
+        try:
+            return await embed_text(transcript.head(2000))
+        except Exception as e:
+            log.warning("Semantic cache disabled for this run: %s", e)
+            return None
+
     def _transition(self, phrase: str) -> str:
         return f"\n\n_{phrase}_\n\n"
 
-    def _assemble(self, sections: Dict[str, str]) -> str:
-        parts = []
-
-        title = sections.get("title", "").strip()
-        if title:
-            parts.append(title)
-
-        intro = sections.get("intro", "").strip()
-        if intro:
-            parts.append(intro)
-
-        context = sections.get("context", "").strip()
-        if context:
-            parts.append(context)
-
-        kp1 = sections.get("key_points_1", "").strip()
-        kp2 = sections.get("key_points_2", "").strip()
-        if kp1:
-            parts.append(self._transition("Here’s where it gets useful…"))
-            parts.append(kp1)
-        if kp2:
-            parts.append(kp2)
-
-        quotes = sections.get("quotes", "").strip()
-        if quotes:
-            parts.append(self._transition("Let’s pull a couple of lines that stuck with me…"))
-            parts.append("## Lines That Matter\n\n" + quotes if not quotes.startswith("##") else quotes)
-
-        summary = sections.get("summary", "").strip()
-        if summary:
-            parts.append(self._transition("So what’s the big picture?"))
-            parts.append(summary)
-
-        wtm = sections.get("what_this_means_for_you", "").strip()
-        if wtm:
-            parts.append(self._transition("Let’s make this practical."))
-            parts.append(wtm)
-
-        conclusion = sections.get("conclusion", "").strip()
-        if conclusion:
-            parts.append(self._transition("One honest caveat before we wrap up…"))
-            parts.append(conclusion)
-
-        tags = sections.get("tags", "").strip()
-        if tags:
-            parts.append(tags)
-
-        # Final pass: remove duplicates and templated starts
-        cleaned = []
-        seen_starts = set()
+    def _section_parts(self, name: str, text: str) -> List[str]:
+        """Blocks one section contributes to the post: its transition, then its text."""
+        text = (text or "").strip()
+        if not text:
+            return []
+        if name == "quotes" and not text.startswith("##"):
+            text = "## Lines That Matter\n\n" + text
+        phrase = TRANSITIONS.get(name)
+        return [self._transition(phrase), text] if phrase else [text]
+
+    def _clean(self, parts: List[str], seen_starts: set) -> Iterator[str]:
+        # Remove duplicates and templated starts across the whole post
         for block in parts:
-            start_key = " ".join(block.strip().split()[:8]).lower()
+            start_key = first_words(block, 8).lower()
             if start_key in seen_starts:
                 continue
             if any(bp in block.lower() for bp in BANNED_PHRASES):
                 continue
             seen_starts.add(start_key)
-            cleaned.append(block)
+            yield block
 
+    def _assemble(self, sections: Dict[str, str]) -> str:
+        seen_starts: set = set()
+        cleaned = [
+            block
+            for name in POST_ORDER
+            for block in self._clean(self._section_parts(name, sections.get(name, "")), seen_starts)
+        ]
         return "\n\n".join(cleaned) if cleaned else "No content generated."
 
-    async def generate_blog_post(self, youtube_url: str) -> Dict[str, str]:
-        print(f"[Orchestrator] Starting generation: {youtube_url}")
-        raw_transcript = await fetch_transcript(youtube_url)
+    async def _generate_combined(self, transcript: GenerationContext) -> Dict[str, str]:
+        """Single-request draft of every section; empty dict if it fails."""
+        try:
+            return await self.combined_worker.generate_sections(transcript)
+        except Exception as e:
+            log.warning("Combined generation failed, using per-section workers: %s", e)
+            return {}
+
+    async def _generate_batched(self, routing_payloads: Dict[str, GenerationContext],
+                                transcript: GenerationContext) -> Dict[str, str]:
+        """Queue one request per section in an OpenAI batch and wait for the results."""
+        requests = {
+            name: worker.batch_request(routing_payloads.get(name, transcript))
+            for name, worker in self.workers.items()
+        }
+        batch_id = await submit_batch(requests)
+        log.info("Submitted batch %s (%d sections)", batch_id, len(requests))
+        results = await wait_for_batch(batch_id)
+        return {
+            name: worker.format_output(results[name]) if results.get(name) else ""
+            for name, worker in self.workers.items()
+        }
+
+    async def _prepare(self, youtube_url: str):
+        """Fetch the transcript and route a context to every section."""
+        log.info("Starting generation: %s", youtube_url)
+        # Warm the OpenAI connection while the transcript downloads
+        raw_transcript, _ = await asyncio.gather(fetch_transcript(youtube_url), prewarm())
         transcript = self._enhance_if_thin(raw_transcript, youtube_url)
 
-        chunks = chunk_text(transcript, 800)
-        first = chunks[0] if chunks else transcript
-        mid = chunks[len(chunks)//2] if chunks else transcript
-        last = chunks[-1] if chunks else transcript
+        # One context per distinct payload: sections routed the same slice share
+        # its token ids, chunks and trims instead of each recomputing them
+        full = GenerationContext(transcript)
+        chunks = [GenerationContext(c) for c in full.chunks]
+        first = chunks[0] if chunks else full
+        mid = chunks[len(chunks)//2] if chunks else full
+        last = chunks[-1] if chunks else full
 
         # Route transcript slices by section
-        routing_payloads = {
+        routing_payloads: Dict[str, GenerationContext] = {
             "title": first,
             "intro": first,
             "context": first,
             "key_points_1": mid,
             "key_points_2": last if len(chunks) > 1 else mid,
-            "quotes": transcript,
-            "summary": transcript,
+            "quotes": full,
+            "summary": full,
             "what_this_means_for_you": last,
             "conclusion": last,
             "seo": first,
-            "tags": transcript[:1000],
+            "tags": GenerationContext(full.head(250)),
         }
+        return raw_transcript, full, routing_payloads
 
-        # Minimum words per section (to avoid generic, too-short outputs)
-        min_words = {
-            "title": 1,
-            "intro": 150,
-            "context": 120,
-            "key_points_1": 220,
-            "key_points_2": 220,
-            "quotes": 120,
-            "summary": 150,
-            "what_this_means_for_you": 150,
-            "conclusion": 120,
-            "seo": 1,
-            "tags": 1,
-        }
+    async def _start_sections(self, full: GenerationContext, routing_payloads: Dict[str, GenerationContext],
+                              combined: Optional[bool],
+                              sinks: Optional[Dict[str, "asyncio.Queue[Optional[str]]"]] = None
+                              ) -> Dict[str, "asyncio.Task[str]"]:
+        """
+        Start every section as its own task. Sections are independent and
+        network-bound, so they run concurrently: wall time is the slowest
+        section rather than the sum of all of them. A section with a queue in
+        `sinks` puts its text there as it is written, then None when done.
+        """
+        if combined is None:
+            combined = get_settings()["combined_generation"]
+        embedding = await self._embed_for_cache(full)
 
-        # Run workers with retry + quality gates
-        sections: Dict[str, str] = {}
-        for name, worker in self.workers.items():
+        drafts = await self._generate_combined(full) if combined else {}
+
+        async def run_section(name: str, worker) -> str:
+            sink = (sinks or {}).get(name)
+            try:
+                return await write_section(name, worker, sink)
+            finally:
+                if sink is not None:
+                    sink.put_nowait(None)
+
+        async def write_section(name: str, worker, sink) -> str:
+            floor = MIN_WORDS.get(name, 120)
+            draft = drafts.get(name, "")
+            if draft:
+                draft = worker.format_output(draft)
+            if draft and not is_low_quality(draft, floor):
+                log.debug("Section %s: %d chars (combined)", name, len(draft))
+                if sink is not None:
+                    sink.put_nowait(draft.strip())
+                return draft
+            if embedding is not None:
+                # Scores every stored vector in Python; off the loop so other
+                # sections (and other users' runs) keep making progress
+                cached = await asyncio.to_thread(response_cache.semantic_lookup, name, embedding)
+                if cached:
+                    log.debug("Section %s: semantic cache hit", name)
+                    if sink is not None:
+                        sink.put_nowait(cached.strip())
+                    return cached
             try:
                 # Temporarily patch each worker to accept routed payload by appending it
                 # to the transcript to bias generation (workers read transcript only).
-                routed_transcript = routing_payloads.get(name, transcript)
-                out = await self._run_with_retry(worker, routed_transcript, min_words.get(name, 120))
-                sections[name] = out
-                print(f"[Orchestrator] Section {name}: {len(out or '')} chars")
+                routed_transcript = routing_payloads.get(name, full)
+                out = await self._run_with_retry(worker, routed_transcript, floor, sink=sink)
+                log.debug("Section %s: %d chars", name, len(out or ""))
+                if embedding is not None and not is_low_quality(out, floor):
+                    await asyncio.to_thread(response_cache.semantic_store, name, embedding, out)
+                return out
             except Exception as e:
-                print(f"[Orchestrator] Worker {name} error: {e}")
-                sections[name] = ""
+                log.warning("Worker %s error: %s", name, e)
+                return ""
+
+        # Run workers with retry + quality gates
+        return {
+            name: asyncio.ensure_future(run_section(name, worker))
+            for name, worker in self.workers.items()
+        }
+
+    async def generate_blog_post(self, youtube_url: str, combined: Optional[bool] = None,
+                                 batch: bool = False) -> Dict[str, str]:
+        """
+        Generate the blog. With combined=True all sections come from one OpenAI
+        request; only sections it leaves missing or too thin run their own worker.
+        combined=None follows the COMBINED_GENERATION setting.
+        With batch=True every section is queued through the Batch API instead
+        (half price, but results can take up to 24h; no retries or quality gates).
+        Batch mode is for offline runs (blog_generator.py --batch) only: the web
+        app must never pass it, as its page would wait on the call for hours.
+        """
+        raw_transcript, full, routing_payloads = await self._prepare(youtube_url)
+
+        if batch:
+            sections = await self._generate_batched(routing_payloads, full)
+            return self._result(sections, raw_transcript, full.text)
+
+        tasks = await self._start_sections(full, routing_payloads, combined)
+        results = await asyncio.gather(*tasks.values())
+        sections: Dict[str, str] = dict(zip(tasks, results))
+        return self._result(sections, raw_transcript, full.text)
+
+    @staticmethod
+    async def _batches(sink: "asyncio.Queue[Optional[str]]") -> AsyncIterator[str]:
+        """
+        A section's text from its queue until the closing None. Whatever has
+        queued up by the time the reader gets to it comes out as one piece, so a
+        section that finished while another streamed costs one redraw, not one
+        per delta batch.
+        """
+        while True:
+            batch = [await sink.get()]
+            while not sink.empty():
+                batch.append(sink.get_nowait())
+            done = batch[-1] is None
+            text = "".join(p for p in batch if p is not None)
+            if text:
+                yield text
+            if done:
+                return
+
+    async def stream_blog_post(self, youtube_url: str,
+                               combined: Optional[bool] = None) -> AsyncIterator[Union[str, Dict]]:
+        """
+        Same post as generate_blog_post, yielded while it is written: the
+        topmost unfinished section streams token by token while the others run
+        concurrently, and each later section follows, buffered text first, as
+        soon as the one above it is done. Then the result dict.
+
+        The pieces are a live preview. The result's content is the final post
+        and can differ from them: a section that failed the quality gate was
+        rewritten, and duplicate or banned blocks were dropped.
+        """
+        raw_transcript, full, routing_payloads = await self._prepare(youtube_url)
+        sinks = {name: asyncio.Queue() for name in POST_ORDER}
+        tasks = await self._start_sections(full, routing_payloads, combined, sinks)
+        try:
+            emitted = False
+            for name in POST_ORDER:
+                sink = sinks[name]
+                started = False
+                # Trailing whitespace is held back until more text follows, since the
+                # final post strips it from the end of every section
+                held = ""
+                async for piece in self._batches(sink):
+                    if not started:
+                        # Lay sections out as _assemble does once the first piece shows
+                        # there is content: separator, transition, quotes heading
+                        started = True
+                        lead = "\n\n" if emitted else ""
+                        phrase = TRANSITIONS.get(name)
+                        if phrase:
+                            lead += self._transition(phrase) + "\n\n"
+                        if name == "quotes" and not piece.startswith("##"):
+                            lead += "## Lines That Matter\n\n"
+                        piece = lead + piece
+                        emitted = True
+                    text = held + piece
+                    body = text.rstrip()
+                    held = text[len(body):]
+                    if body:
+                        yield body
+                # Draining a queue that already holds every piece does not suspend;
+                # yield the loop explicitly so a run of ready sections cannot hog it
+                await asyncio.sleep(0)
+            results = await asyncio.gather(*tasks.values())
+            yield self._result(dict(zip(tasks, results)), raw_transcript, full.text)
+        finally:
+            # The reader can stop early (a Streamlit rerun or stop ends the
+            # script, which closes this generator); sections still being written
+            # for it are cancelled rather than left running on the shared loop
+            for task in tasks.values():
+                task.cancel()
 
+    def _result(self, sections: Dict[str, str], raw_transcript: str, transcript: str) -> Dict:
         # Assemble and return
         content = self._assemble(sections)
+        succeeded = sum(1 for v in sections.values() if v and len(v.strip())>20)
 
         stats = {
             "transcript_length": len(raw_transcript or ""),
             "enhanced_transcript_length": len(transcript or ""),
             "blog_length": len(content or ""),
-            "word_count": len(content.split()),
-            "success_rate": f"{sum(1 for v in sections.values() if v and len(v.strip())>20)}/{len(sections)}"
+            "word_count": count_words(content),
+            "success_rate": f"{succeeded}/{len(sections)}",
+            # Written from a padded stand-in transcript, or mostly empty sections
+            "emergency_mode": transcript != raw_transcript or succeeded < len(sections) * MIN_SUCCESS_RATIO,
         }
 
         return {
@@ -3,6 +3,8 @@ from pathlib import Path
 from tempfile import TemporaryDirectory
 from typing import Tuple
 
+from config.settings import get_settings
+
 def download_best_audio(url: str) -> Tuple[Path, str]:
     """
     Use yt-dlp to fetch the highest-quality audio only.
@@ -24,7 +26,7 @@ def download_best_audio(url: str) -> Tuple[Path, str]:
         # yt-dlp already saved the file; find it
         audio_file = next(Path(tmp).glob("audio.*"))
         # move to project cache
-        cache_dir = Path(".cache/audio")
+        cache_dir = get_settings()["cache_dir"] / "audio"
         cache_dir.mkdir(parents=True, exist_ok=True)
         final_path = cache_dir / f"{meta['id']}{audio_file.suffix}"
         audio_file.rename(final_path)
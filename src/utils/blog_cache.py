@@ -0,0 +1,63 @@
+"""
+blog_cache.py - persistent cache of finished blog posts
+Keyed by video and orchestrator version, so restarts and other app processes
+reuse finished posts; least recently used entries are evicted past MAX_ENTRIES.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from utils.response_cache import CACHE_DIR
+
+# ── Constants ───────────────────────────────────────────────
+DB_PATH = CACHE_DIR / "blog_posts.sqlite3"
+MAX_ENTRIES = 500
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        _conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS posts ("
+            "key TEXT PRIMARY KEY, data TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        _conn.commit()
+    return _conn
+
+def make_key(video_url: str, version: str) -> str:
+    """Key over the canonical video URL and the orchestrator version that wrote the post."""
+    return hashlib.sha256(f"{video_url}|{version}".encode("utf-8")).hexdigest()
+
+def lookup(key: str) -> Optional[dict]:
+    """Return the cached post for key, or None."""
+    with _lock:
+        conn = _db()
+        row = conn.execute("SELECT data FROM posts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE posts SET last_used = ? WHERE key = ?", (time.time(), key))
+        conn.commit()
+    return json.loads(row[0])
+
+def store(key: str, data: dict) -> None:
+    """Store a post under key, evicting the least recently used beyond MAX_ENTRIES."""
+    with _lock:
+        conn = _db()
+        conn.execute(
+            "INSERT OR REPLACE INTO posts (key, data, last_used) VALUES (?, ?, ?)",
+            (key, json.dumps(data, ensure_ascii=False), time.time()),
+        )
+        conn.execute(
+            "DELETE FROM posts WHERE key NOT IN "
+            "(SELECT key FROM posts ORDER BY last_used DESC LIMIT ?)",
+            (MAX_ENTRIES,),
+        )
+        conn.commit()
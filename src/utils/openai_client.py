@@ -5,10 +5,20 @@ Works with ANY environment and handles all import failures gracefully
 
 import os
 import asyncio
+import functools
+import logging
+import weakref
 from typing import Dict, List
 
+log = logging.getLogger(__name__)
+
+# Same as workers.implementations._SECRET_ERRORS: no secrets.toml, no key in
+# it, or a file that is not valid TOML all fall through to the environment
+_SECRET_ERRORS = (KeyError, FileNotFoundError, ValueError)
+
+@functools.lru_cache(maxsize=1)
 def get_api_key():
-    """Get OpenAI API key from Streamlit secrets or environment."""
+    """Get OpenAI API key from Streamlit secrets or environment (resolved once)."""
     api_key = None
     
     # Try Streamlit secrets first
@@ -16,15 +26,15 @@ def get_api_key():
         import streamlit as st
         api_key = st.secrets.get("OPENAI_API_KEY")
         if api_key:
-            print("[OpenAI Client] Using API key from Streamlit secrets")
+            log.debug("Using API key from Streamlit secrets")
             return api_key
-    except:
+    except (ImportError,) + _SECRET_ERRORS:
         pass
     
     # Try environment variable
     api_key = os.getenv("OPENAI_API_KEY")
     if api_key:
-        print("[OpenAI Client] Using API key from environment")
+        log.debug("Using API key from environment")
         return api_key
     
     # Final fallback
@@ -34,6 +44,27 @@ def get_api_key():
         "2. Set as environment variable"
     )
 
+# The SDK client and the aiohttp session pool connections bound to the event
+# loop that opened them, so one of each is kept per loop and reused by every call
+_SDK_CLIENTS = weakref.WeakKeyDictionary()
+_SESSIONS = weakref.WeakKeyDictionary()
+
+def _sdk_client(api_key: str):
+    from openai import AsyncOpenAI
+    loop = asyncio.get_running_loop()
+    client = _SDK_CLIENTS.get(loop)
+    if client is None:
+        client = _SDK_CLIENTS[loop] = AsyncOpenAI(api_key=api_key)
+    return client
+
+def _http_session():
+    import aiohttp
+    loop = asyncio.get_running_loop()
+    session = _SESSIONS.get(loop)
+    if session is None or session.closed:
+        session = _SESSIONS[loop] = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60))
+    return session
+
 async def chat(messages: List[Dict], model: str = "gpt-4", max_tokens: int = 2000):
     """
     Universal chat function that works even if OpenAI SDK fails to import.
@@ -44,8 +75,7 @@ async def chat(messages: List[Dict], model: str = "gpt-4", max_tokens: int = 200
     # Strategy 1: Try OpenAI SDK
     try:
         # Try new SDK format
-        from openai import AsyncOpenAI
-        client = AsyncOpenAI(api_key=api_key)
+        client = _sdk_client(api_key)
         response = await client.chat.completions.create(
             model=model,
             messages=messages,
@@ -54,9 +84,9 @@ async def chat(messages: List[Dict], model: str = "gpt-4", max_tokens: int = 200
         )
         return response.choices[0].message.content
     except ImportError:
-        print("[OpenAI Client] AsyncOpenAI not available, trying alternative...")
+        log.debug("AsyncOpenAI not available, trying alternative...")
     except Exception as e:
-        print(f"[OpenAI Client] AsyncOpenAI failed: {e}")
+        log.debug("AsyncOpenAI failed: %s", e)
 
     # Strategy 2: Try old SDK format
     try:
@@ -74,15 +104,12 @@ async def chat(messages: List[Dict], model: str = "gpt-4", max_tokens: int = 200
         
         return await asyncio.to_thread(_sync_call)
     except ImportError:
-        print("[OpenAI Client] Legacy openai not available, using HTTP fallback...")
+        log.debug("Legacy openai not available, using HTTP fallback...")
     except Exception as e:
-        print(f"[OpenAI Client] Legacy openai failed: {e}")
+        log.debug("Legacy openai failed: %s", e)
 
     # Strategy 3: Direct HTTP requests (always works)
     try:
-        import aiohttp
-        import json
-        
         headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
@@ -95,19 +122,17 @@ async def chat(messages: List[Dict], model: str = "gpt-4", max_tokens: int = 200
             "temperature": 0.7
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=aiohttp.ClientTimeout(total=60)
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result["choices"][0]["message"]["content"]
-                else:
-                    error_text = await response.text()
-                    raise Exception(f"OpenAI API Error {response.status}: {error_text}")
+        async with _http_session().post(
+            "https://api.openai.com/v1/chat/completions",
+            headers=headers,
+            json=data,
+        ) as response:
+            if response.status == 200:
+                result = await response.json()
+                return result["choices"][0]["message"]["content"]
+            else:
+                error_text = await response.text()
+                raise Exception(f"OpenAI API Error {response.status}: {error_text}")
                     
     except Exception as e:
         raise Exception(f"All OpenAI strategies failed: {str(e)}")
@@ -118,8 +143,8 @@ async def test_openai_connection():
     try:
         test_messages = [{"role": "user", "content": "Say 'Hello, I work!'"}]
         response = await chat(test_messages, model="gpt-3.5-turbo", max_tokens=20)
-        print(f"[OpenAI Client] ✅ Connection test successful: {response}")
+        log.info("✅ Connection test successful: %s", response)
         return True
     except Exception as e:
-        print(f"[OpenAI Client] ❌ Connection test failed: {e}")
+        log.error("❌ Connection test failed: %s", e)
         return False
@@ -0,0 +1,186 @@
+"""
+response_cache.py - exact-match cache for OpenAI completions
+Keys are SHA256 digests of the full request payload; values live in SQLite,
+fronted by a small in-process LRU so repeats within a process skip the disk.
+"""
+
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from config.settings import get_settings
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    orjson = None
+    HAS_ORJSON = False
+
+# ── Constants ───────────────────────────────────────────────
+CACHE_DIR: Path = get_settings()["cache_dir"]
+DB_PATH = CACHE_DIR / "responses.sqlite3"
+DEFAULT_EXPIRE = 7 * 86400  # one week
+MEMORY_ENTRIES = 512
+# Expired rows are swept from disk once every this many stores
+PURGE_EVERY = 100
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+_memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+_writes = 0
+
+def _remember(key: str, content: str, expires_at: float) -> None:
+    _memory[key] = (content, expires_at)
+    _memory.move_to_end(key)
+    while len(_memory) > MEMORY_ENTRIES:
+        _memory.popitem(last=False)
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        _conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, content TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        _conn.commit()
+    return _conn
+
+def make_key(payload: dict) -> str:
+    """Deterministic key over model, messages and sampling parameters."""
+    # Stays on stdlib json: keys must not change with whether orjson is installed
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()
+
+def lookup(key: str) -> Optional[str]:
+    """Return the cached content for key, or None if missing or expired."""
+    now = time.time()
+    with _lock:
+        hit = _memory.get(key)
+        if hit is not None and hit[1] >= now:
+            _memory.move_to_end(key)
+            return hit[0]
+        conn = _db()
+        row = conn.execute(
+            "SELECT content, expires_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        content, expires_at = row
+        if expires_at < now:
+            # Drop the stale row rather than leave it for the periodic sweep
+            _memory.pop(key, None)
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            conn.commit()
+            return None
+        _remember(key, content, expires_at)
+    return content
+
+def store(key: str, content: str, expire: int = DEFAULT_EXPIRE) -> None:
+    """Store content under key for expire seconds, sweeping expired rows every PURGE_EVERY writes."""
+    global _writes
+    now = time.time()
+    with _lock:
+        _remember(key, content, now + expire)
+        conn = _db()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, content, expires_at) VALUES (?, ?, ?)",
+            (key, content, now + expire),
+        )
+        _writes += 1
+        if _writes % PURGE_EVERY == 0:
+            conn.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+        conn.commit()
+
+# ── Semantic layer ──────────────────────────────────────────
+# Near-duplicate transcripts (same topic, paraphrased) miss the exact-match
+# table, so results are also stored next to an embedding of their input.
+SIMILARITY_THRESHOLD = 0.92
+# Rows kept per namespace (one namespace per section); the oldest go first
+MAX_SEMANTIC_ENTRIES = 200
+
+def _semantic_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS semantic ("
+        "namespace TEXT NOT NULL, vector TEXT NOT NULL, norm REAL NOT NULL, "
+        "content TEXT NOT NULL, expires_at REAL NOT NULL)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS semantic_namespace ON semantic (namespace, expires_at)"
+    )
+
+# Embedding vectors are ~1.5k floats each and every lookup decodes all rows,
+# so they go through orjson when available (the stored text is plain JSON either way)
+def _encode_vector(vector: List[float]) -> str:
+    return orjson.dumps(vector).decode("utf-8") if HAS_ORJSON else json.dumps(vector)
+
+def _decode_vector(raw: str) -> List[float]:
+    return orjson.loads(raw) if HAS_ORJSON else json.loads(raw)
+
+def _norm(vector: List[float]) -> float:
+    return math.sqrt(sum(x * x for x in vector))
+
+def _live_rows(conn: sqlite3.Connection, namespace: str) -> List[Tuple[int, str, float, str]]:
+    return conn.execute(
+        "SELECT rowid, vector, norm, content FROM semantic WHERE namespace = ? AND expires_at >= ?",
+        (namespace, time.time()),
+    ).fetchall()
+
+def _similar(rows: List[Tuple[int, str, float, str]], vector: List[float], q_norm: float,
+             threshold: float) -> Iterator[Tuple[int, str, float]]:
+    """(rowid, content, score) of the rows scoring at least threshold against vector."""
+    for rowid, raw, norm, content in rows:
+        other = _decode_vector(raw)
+        score = sum(a * b for a, b in zip(vector, other)) / (q_norm * norm)
+        if score >= threshold:
+            yield rowid, content, score
+
+def semantic_lookup(namespace: str, vector: List[float],
+                    threshold: float = SIMILARITY_THRESHOLD) -> Optional[str]:
+    """Return the stored content whose embedding is most similar, if above threshold."""
+    q_norm = _norm(vector)
+    if not q_norm:
+        return None
+    with _lock:
+        conn = _db()
+        _semantic_table(conn)
+        rows = _live_rows(conn, namespace)
+    best = max(_similar(rows, vector, q_norm, threshold), key=lambda m: m[2], default=None)
+    return best[1] if best else None
+
+def semantic_store(namespace: str, vector: List[float], content: str,
+                   expire: int = DEFAULT_EXPIRE) -> None:
+    """
+    Remember content for inputs similar to the embedded one. Rows it would
+    shadow (same or near-identical input) are replaced, expired rows dropped
+    and the namespace capped at MAX_SEMANTIC_ENTRIES.
+    """
+    norm = _norm(vector)
+    if not norm:
+        return
+    now = time.time()
+    with _lock:
+        conn = _db()
+        _semantic_table(conn)
+        rows = _live_rows(conn, namespace)
+        stale = [(rowid,) for rowid, _, _ in _similar(rows, vector, norm, SIMILARITY_THRESHOLD)]
+        conn.executemany("DELETE FROM semantic WHERE rowid = ?", stale)
+        conn.execute("DELETE FROM semantic WHERE expires_at < ?", (now,))
+        conn.execute(
+            "INSERT INTO semantic (namespace, vector, norm, content, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (namespace, _encode_vector(vector), norm, content, now + expire),
+        )
+        conn.execute(
+            "DELETE FROM semantic WHERE namespace = ? AND rowid NOT IN "
+            "(SELECT rowid FROM semantic WHERE namespace = ? ORDER BY expires_at DESC LIMIT ?)",
+            (namespace, namespace, MAX_SEMANTIC_ENTRIES),
+        )
+        conn.commit()
@@ -13,6 +13,8 @@ import time
 from pathlib import Path
 from typing import Optional
 
+from config.settings import get_settings
+
 try:
     from youtube_transcript_api import YouTubeTranscriptApi
     HAS_TRANSCRIPT_API = True
@@ -23,7 +25,7 @@ except ImportError:
 # ── Constants ───────────────────────────────────────────────
 _ID_RE = re.compile(r"(?:v=|/)([0-9A-Za-z_-]{11})")
 
-CACHE_DIR = Path(".cache")
+CACHE_DIR = get_settings()["cache_dir"]
 TEXT_CACHE = CACHE_DIR / "transcripts"
 TEXT_CACHE.mkdir(parents=True, exist_ok=True)
 
@@ -51,7 +53,7 @@ def _clean_text(text: str) -> str:
     
     return text.strip()
 
-async def _extract_youtube_captions(vid: str) -> Optional[str]:
+def _extract_youtube_captions(vid: str) -> Optional[str]:
     """Extract captions using YouTube Transcript API."""
     if not HAS_TRANSCRIPT_API:
         print(f"[Processor] YouTube Transcript API not available")
@@ -98,7 +100,7 @@ async def _extract_youtube_captions(vid: str) -> Optional[str]:
         print(f"[Processor] Caption extraction error: {e}")
         return None
 
-async def _extract_video_metadata(vid: str) -> Optional[str]:
+def _extract_video_metadata(vid: str) -> Optional[str]:
     """Extract video metadata when captions aren't available."""
     try:
         print(f"[Processor] Trying metadata extraction for {vid}...")
@@ -194,7 +196,7 @@ Key themes that may be discussed include the main topic areas suggested by the v
         print(f"[Processor] Metadata extraction error: {e}")
         return None
 
-async def _extract_oembed_data(vid: str) -> Optional[str]:
+def _extract_oembed_data(vid: str) -> Optional[str]:
     """Try oEmbed API as additional fallback."""
     try:
         print(f"[Processor] Trying oEmbed for {vid}...")
@@ -258,7 +260,9 @@ async def fetch_transcript(url: str) -> str:
         for strategy_name, strategy_func in strategies:
             try:
                 print(f"[Processor] Trying: {strategy_name}")
-                content = await strategy_func(vid)
+                # The extractors make blocking HTTP calls; a worker thread keeps
+                # them from stalling every other coroutine on the event loop
+                content = await asyncio.to_thread(strategy_func, vid)
                 
                 if content and len(content.strip()) > 100:
                     extracted_content = content.strip()
@@ -1,116 +1,765 @@
 from __future__ import annotations
-import requests
+import asyncio
+import functools
+from itertools import islice
+import httpx
 import json
+import logging
 import os
+import random
+import re
 import streamlit as st
-from typing import List, Dict, Optional
+import weakref
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import (
+    AsyncIterator, ClassVar, Dict, Final, Iterator, List, Mapping, NamedTuple, Optional, Tuple, Union
+)
+
+from utils import response_cache
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    orjson = None
+    HAS_ORJSON = False
+
+try:
+    import tiktoken
+    HAS_TIKTOKEN = True
+except ImportError:
+    tiktoken = None
+    HAS_TIKTOKEN = False
+
+log = logging.getLogger(__name__)
+
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+# Default for every worker; cheaper and lower-latency than gpt-3.5-turbo
+CHAT_MODEL = "gpt-4o-mini"
+OPENAI_EMBEDDINGS_URL = "https://api.openai.com/v1/embeddings"
+OPENAI_FILES_URL = "https://api.openai.com/v1/files"
+OPENAI_BATCHES_URL = "https://api.openai.com/v1/batches"
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# One pooled client shared by every worker: keep-alive means the TCP+TLS
+# handshake to api.openai.com is paid once instead of once per section, and
+# HTTP/2 lets the concurrent section requests multiplex over one connection.
+# Async connections belong to the loop that opened them, hence one per loop.
+_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+def get_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _CLIENTS.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            http2=True,
+            timeout=120,
+            limits=httpx.Limits(max_keepalive_connections=16, max_connections=20,
+                                keepalive_expiry=300),
+        )
+        _CLIENTS[loop] = client
+    return client
+
+async def prewarm() -> None:
+    """Open the pooled connection (DNS, TCP, TLS, ALPN) ahead of the first real request."""
+    try:
+        await get_client().head("https://api.openai.com/v1/models", timeout=10)
+    except httpx.HTTPError:
+        # Best effort: the first real request simply pays the handshake instead
+        pass
 
 # -----------------------
 # Utilities
 # -----------------------
 
-def get_api_key() -> str:
+def _dumps(obj) -> bytes:
+    # orjson serializes request bodies several times faster than stdlib json
+    return orjson.dumps(obj) if HAS_ORJSON else json.dumps(obj).encode("utf-8")
+
+def _loads(raw):
+    return orjson.loads(raw) if HAS_ORJSON else json.loads(raw)
+
+# Missing secrets.toml raises FileNotFoundError (newer Streamlit versions use a
+# subclass of it); a secrets file without the key raises KeyError, and one
+# that is not valid TOML raises the parser's decode error, a ValueError.
+_SECRET_ERRORS = (KeyError, FileNotFoundError, ValueError)
+
+@functools.lru_cache(maxsize=1)
+def _resolve_openai_key() -> str:
+    # The key cannot change while the process runs, so resolve it once
     try:
         key = st.secrets["OPENAI_API_KEY"]
         if key and key.startswith("sk-"):
             return key
-    except Exception:
+    except _SECRET_ERRORS:
         pass
     key = os.getenv("OPENAI_API_KEY")
     if key and key.startswith("sk-"):
         return key
     raise ValueError("OpenAI API key not found or invalid format")
 
-def call_openai(messages: List[Dict], max_tokens: int = 1200, temperature: float = 0.8) -> str:
-    api_key = get_api_key()
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+def get_api_key() -> str:
+    return _resolve_openai_key()
+
+def _chat_payload(messages: List[Dict], max_tokens: int, temperature: float,
+                  response_format: Optional[Dict] = None, model: str = CHAT_MODEL) -> Dict:
     payload = {
-        "model": "gpt-3.5-turbo",
-        "messages": messages,
+        "model": model,
+        "messages": [dict(m) for m in messages],
         "max_tokens": max_tokens,
         "temperature": temperature,
         "presence_penalty": 0.2,
         "frequency_penalty": 0.2
     }
-    resp = requests.post("https://api.openai.com/v1/chat/completions",
-                         headers=headers, json=payload, timeout=120)
+    if response_format:
+        payload["response_format"] = response_format
+    return payload
+
+@functools.lru_cache(maxsize=1)
+def _auth_headers() -> Mapping[str, str]:
+    # Built once, like the key itself; read-only since every request shares it
+    return MappingProxyType({"Authorization": f"Bearer {get_api_key()}", "Content-Type": "application/json"})
+
+# Rate limits, transient server errors, timeouts and dropped connections are
+# retried with jittered exponential backoff instead of failing the whole
+# section. Other 4xx responses are permanent and returned straight away.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+MAX_ATTEMPTS = 5
+BACKOFF_MAX = 30.0
+
+def _retry_delay(attempt: int, resp: Optional[httpx.Response] = None) -> float:
+    # Honor the server's Retry-After (seconds) when it sends one
+    retry_after = resp.headers.get("retry-after") if resp is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    return min(BACKOFF_MAX, 2 ** attempt + random.uniform(0, 1))
+
+async def _post(url: str, body: bytes) -> httpx.Response:
+    client = get_client()
+    for attempt in range(MAX_ATTEMPTS):
+        last_try = attempt == MAX_ATTEMPTS - 1
+        try:
+            resp = await client.post(url, headers=_auth_headers(), content=body)
+        except httpx.TransportError:
+            # Timeouts, resets and refused connections
+            if last_try:
+                raise
+            await asyncio.sleep(_retry_delay(attempt))
+            continue
+        if resp.status_code not in RETRY_STATUSES or last_try:
+            return resp
+        await asyncio.sleep(_retry_delay(attempt, resp))
+    return resp
+
+async def call_openai(messages: List[Dict], max_tokens: int = 1200, temperature: float = 0.8,
+                response_format: Optional[Dict] = None, model: str = CHAT_MODEL) -> str:
+    payload = _chat_payload(messages, max_tokens, temperature, response_format, model)
+    cache_key = response_cache.make_key(payload)
+    # The cache reads and writes SQLite under a lock; off the loop, so other
+    # sections and other sessions' runs keep going meanwhile
+    cached = await asyncio.to_thread(response_cache.lookup, cache_key)
+    if cached is not None:
+        return cached
+    resp = await _post(OPENAI_CHAT_URL, _dumps(payload))
     if resp.status_code != 200:
         raise RuntimeError(f"OpenAI API Error {resp.status_code}: {resp.text[:400]}")
-    data = resp.json()
-    return data["choices"][0]["message"]["content"].strip()
-
-def persona_system_message() -> Dict:
-    return {
-        "role": "system",
-        "content": (
-            "You are a machine learning researcher and educator. "
-            "Your audience is ML enthusiasts of all ages. "
-            "Write like you’re talking to a smart friend: conversational, direct, and occasionally witty. "
-            "Vary sentence length. Use transitions like “Here’s the thing,” “Let’s be honest,” “What I’ve found is…”. "
-            "Avoid buzzwords and corporate talk. Never use words like “delve,” “leverage,” “robust,” "
-            "“seamless,” “cutting-edge,” “game-changing,” “furthermore,” “navigate,” “elevate,” “comprehensive.” "
-            "Keep everything concrete, readable, and useful."
-        )
-    }
+    data = _loads(resp.content)
+    content = data["choices"][0]["message"]["content"].strip()
+    _report_usage(data.get("usage") or {})
+    await asyncio.to_thread(response_cache.store, cache_key, content)
+    return content
+
+def _report_usage(usage: Dict) -> None:
+    # Prompt size comes from OpenAI's own token counts, so nothing is measured
+    # client-side and nothing at all happens unless DEBUG is on.
+    if not log.isEnabledFor(logging.DEBUG):
+        return
+    log.debug("Request used %s prompt + %s completion tokens",
+              usage.get("prompt_tokens"), usage.get("completion_tokens"))
+    # OpenAI discounts a byte-identical prompt prefix it has seen recently; the
+    # persona-first message layout exists so these hits show up here.
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    if cached:
+        log.debug("Prompt cache hit: %s/%s prompt tokens", cached, usage.get("prompt_tokens"))
+
+async def stream_openai(messages: List[Dict], max_tokens: int = 1200,
+                        temperature: float = 0.8, model: str = CHAT_MODEL) -> AsyncIterator[str]:
+    """
+    Same request as `call_openai`, but yields content deltas from the SSE stream
+    as they arrive. A cache hit is yielded whole; only a stream that reached
+    its [DONE] event is cached, so a cut-off one never poisons the cache.
+    """
+    payload = _chat_payload(messages, max_tokens, temperature, model=model)
+    cache_key = response_cache.make_key(payload)
+    cached = await asyncio.to_thread(response_cache.lookup, cache_key)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    done = False
+    body = _dumps({**payload, "stream": True})
+    for attempt in range(MAX_ATTEMPTS):
+        last_try = attempt == MAX_ATTEMPTS - 1
+        delay = None
+        try:
+            async with get_client().stream("POST", OPENAI_CHAT_URL, headers=_auth_headers(),
+                                           content=body) as resp:
+                if resp.status_code in RETRY_STATUSES and not last_try:
+                    delay = _retry_delay(attempt, resp)
+                elif resp.status_code != 200:
+                    await resp.aread()
+                    raise RuntimeError(f"OpenAI API Error {resp.status_code}: {resp.text[:400]}")
+                else:
+                    async for line in resp.aiter_lines():
+                        if not line.startswith("data: "):
+                            continue
+                        data = line[len("data: "):]
+                        if data == "[DONE]":
+                            done = True
+                            break
+                        event = _loads(data)
+                        if event.get("error"):
+                            raise RuntimeError(f"OpenAI stream error: {str(event['error'])[:400]}")
+                        choices = event.get("choices") or [{}]
+                        delta = choices[0].get("delta", {}).get("content")
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+        except httpx.TransportError:
+            # Text already handed to the caller cannot be taken back, so only
+            # a stream that failed before its first delta is retried
+            if parts or last_try:
+                raise
+            delay = _retry_delay(attempt)
+        if delay is None:
+            break
+        # Back off outside the stream block, as _post does: the throttled
+        # response and its pooled connection are released before the wait
+        await asyncio.sleep(delay)
+    content = "".join(parts).strip()
+    if done and content:
+        await asyncio.to_thread(response_cache.store, cache_key, content)
+    elif not done:
+        log.warning("OpenAI stream ended before [DONE]; %d chars not cached", len(content))
+
+# -----------------------
+# Batch API
+# -----------------------
+# Offline runs can go through the 24h Batch API at half the token price and
+# outside the synchronous rate limits.
 
-def chunk_text(text: str, max_words: int = 800) -> List[str]:
-    words = text.split()
-    chunks = []
-    cur = []
+BATCH_POLL_SECONDS = 30
+BATCH_FAILED_STATUSES = frozenset({"failed", "expired", "cancelled"})
+
+def _check(resp: httpx.Response) -> Dict:
+    if resp.status_code != 200:
+        raise RuntimeError(f"OpenAI API Error {resp.status_code}: {resp.text[:400]}")
+    return _loads(resp.content)
+
+async def submit_batch(requests: Dict[str, "ChatRequest"]) -> str:
+    """Upload one chat-completions line per custom_id and start a batch; returns its id."""
+    lines = [
+        _dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": _chat_payload(r.messages, r.max_tokens, r.temperature, model=r.model),
+        })
+        for custom_id, r in requests.items()
+    ]
+    # Multipart upload: httpx sets its own Content-Type with the boundary
+    auth = {"Authorization": _auth_headers()["Authorization"]}
+    client = get_client()
+    upload = _check(await client.post(
+        OPENAI_FILES_URL, headers=auth, data={"purpose": "batch"},
+        files={"file": ("batch.jsonl", b"\n".join(lines), "application/jsonl")},
+    ))
+    batch = _check(await client.post(OPENAI_BATCHES_URL, headers=_auth_headers(), content=_dumps({
+        "input_file_id": upload["id"],
+        "endpoint": "/v1/chat/completions",
+        "completion_window": "24h",
+    })))
+    return batch["id"]
+
+async def wait_for_batch(batch_id: str, poll_seconds: float = BATCH_POLL_SECONDS) -> Dict[str, str]:
+    """Poll a batch until it completes and return content keyed by custom_id."""
+    client = get_client()
+    while True:
+        batch = _check(await client.get(f"{OPENAI_BATCHES_URL}/{batch_id}", headers=_auth_headers()))
+        if batch["status"] == "completed":
+            break
+        if batch["status"] in BATCH_FAILED_STATUSES:
+            raise RuntimeError(f"OpenAI batch {batch_id} ended with status {batch['status']}")
+        await asyncio.sleep(poll_seconds)
+    results: Dict[str, str] = {}
+    if not batch.get("output_file_id"):
+        return results
+    resp = await client.get(f"{OPENAI_FILES_URL}/{batch['output_file_id']}/content", headers=_auth_headers())
+    if resp.status_code != 200:
+        raise RuntimeError(f"OpenAI API Error {resp.status_code}: {resp.text[:400]}")
+    for line in resp.text.splitlines():
+        if not line.strip():
+            continue
+        item = _loads(line)
+        body = (item.get("response") or {}).get("body") or {}
+        choices = body.get("choices") or []
+        if choices:
+            results[item["custom_id"]] = (choices[0]["message"]["content"] or "").strip()
+    return results
+
+async def embed_text(text: str) -> List[float]:
+    """Embed text with the small embedding model (one call per transcript)."""
+    resp = await _post(OPENAI_EMBEDDINGS_URL, _dumps({"model": EMBEDDING_MODEL, "input": text}))
+    if resp.status_code != 200:
+        raise RuntimeError(f"OpenAI API Error {resp.status_code}: {resp.text[:400]}")
+    return _loads(resp.content)["data"][0]["embedding"]
+
+# Static persona shared by every worker. It must stay byte-identical and go out
+# as messages[0] so OpenAI's automatic prompt caching can reuse the prefix.
+ML_RESEARCHER_INSTRUCTION: Final[str] = (
+    "You are a machine learning researcher and educator. "
+    "Your audience is ML enthusiasts of all ages. "
+    "Write like you’re talking to a smart friend: conversational, direct, and occasionally witty. "
+    "Vary sentence length. Use transitions like “Here’s the thing,” “Let’s be honest,” “What I’ve found is…”. "
+    "Avoid buzzwords and corporate talk. Never use words like “delve,” “leverage,” “robust,” "
+    "“seamless,” “cutting-edge,” “game-changing,” “furthermore,” “navigate,” “elevate,” “comprehensive.” "
+    "Keep everything concrete, readable, and useful."
+)
+
+def spread(items: List[str], limit: int) -> List[str]:
+    """Pick at most `limit` items, evenly spaced, keeping first and last."""
+    if len(items) <= limit:
+        return items
+    step = (len(items) - 1) / (limit - 1)
+    return [items[round(i * step)] for i in range(limit)]
+
+_WORD_RE = re.compile(r"\S+")
+
+def count_words(text: str, stop_at: Optional[int] = None) -> int:
+    """Whitespace word count; with `stop_at`, scans no further than that many words."""
+    if stop_at is None:
+        # A full count is fastest in C: str.split beats stepping through regex
+        # matches in Python about 4x, even though it builds a throwaway list
+        return len(text.split())
+    return sum(1 for _ in islice(_WORD_RE.finditer(text), stop_at))
+
+def first_words(text: str, n: int) -> str:
+    """The first `n` words joined by single spaces, scanning no further."""
+    return " ".join(m.group() for m in islice(_WORD_RE.finditer(text), n))
+
+# Rough characters-per-token ratio for English, used when tiktoken is missing
+CHARS_PER_TOKEN = 4
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    return tiktoken.encoding_for_model(CHAT_MODEL)
+
+def _encode(text: str) -> Optional[List[int]]:
+    # encode_ordinary: transcripts are untrusted, and a caption reading
+    # "<|endoftext|>" would make encode() raise instead of tokenising it as text
+    return _encoding().encode_ordinary(text) if HAS_TIKTOKEN else None
+
+# How far (in tokens) a cut may move to land on a word boundary
+SNAP_TOKENS = 32
+
+def _starts_word(enc, token: int) -> bool:
+    # BPE folds the space before a word into the word's token
+    return enc.decode_single_token_bytes(token)[:1].isspace()
+
+def _starts_char(enc, token: int) -> bool:
+    # A UTF-8 continuation byte (0b10xxxxxx) means the token splits a character
+    head = enc.decode_single_token_bytes(token)[:1]
+    return not head or head[0] & 0xC0 != 0x80
+
+def _snap(ids: List[int], pos: int, back: bool, floor: int = 0) -> int:
+    """
+    Move a cut at `pos` to the nearest word boundary within SNAP_TOKENS,
+    else to a character boundary, so decoded slices never split a word or
+    a multi-byte character. Cuts stay strictly between `floor` and the end.
+    """
+    enc = _encoding()
+    step = -1 if back else 1
+    window = [j for j in range(pos, pos + step * SNAP_TOKENS, step) if floor < j < len(ids)]
+    for starts in (_starts_word, _starts_char):
+        for j in window:
+            if starts(enc, ids[j]):
+                return j
+    return pos
+
+def _trim_ids(text: str, ids: Optional[List[int]], max_tokens: int, from_end: bool) -> str:
+    # Shared by trim_to_tokens and GenerationContext, which pass cached ids
+    if ids is None:
+        limit = max_tokens * CHARS_PER_TOKEN
+        return text[-limit:] if from_end else text[:limit]
+    if len(ids) <= max_tokens:
+        return text
+    enc = _encoding()
+    if from_end:
+        return enc.decode(ids[_snap(ids, len(ids) - max_tokens, back=False):])
+    return enc.decode(ids[:_snap(ids, max_tokens, back=True)])
+
+def trim_to_tokens(text: str, max_tokens: int, from_end: bool = False) -> str:
+    """
+    Keep at most `max_tokens` tokens of text (the last ones if from_end).
+    Budgets are what OpenAI bills and limits on, unlike character counts.
+    """
+    return _trim_ids(text, _encode(text), max_tokens, from_end)
+
+def iter_chunks(text: str, max_words: int = 800) -> Iterator[str]:
+    # Slice the original string between word offsets instead of splitting into
+    # a list of words and re-joining it; whitespace inside a chunk is kept as-is.
+    # Lazy, so callers that only need the opening chunk never scan the rest.
+    start = end = 0
     count = 0
-    for w in words:
-        cur.append(w)
+    for m in _WORD_RE.finditer(text):
+        if count == 0:
+            start = m.start()
+        end = m.end()
         count += 1
         if count >= max_words:
-            chunks.append(" ".join(cur))
-            cur = []
+            yield text[start:end]
             count = 0
-    if cur:
-        chunks.append(" ".join(cur))
-    return chunks
+    if count:
+        yield text[start:end]
+
+# Fan-out and routing chunk size. OpenAI bills and truncates by BPE tokens, so
+# chunks are cut on token boundaries rather than word counts (an 800-word chunk
+# can be anywhere from ~900 to ~2000 tokens).
+CHUNK_TOKENS = 1000
+
+def _chunk_ids(text: str, ids: Optional[List[int]], max_tokens: int) -> Iterator[str]:
+    # Shared by iter_token_chunks and GenerationContext, which pass cached ids
+    if ids is None:
+        # Roughly 3 words per 4 tokens of English
+        yield from iter_chunks(text, max(1, max_tokens * 3 // 4))
+        return
+    enc = _encoding()
+    start = 0
+    while start < len(ids):
+        end = start + max_tokens
+        if end < len(ids):
+            end = _snap(ids, end, back=True, floor=start)
+        yield enc.decode(ids[start:end])
+        start = end
+
+def iter_token_chunks(text: str, max_tokens: int = CHUNK_TOKENS) -> Iterator[str]:
+    return _chunk_ids(text, _encode(text), max_tokens)
+
+def chunk_tokens(text: str, max_tokens: int = CHUNK_TOKENS) -> List[str]:
+    return list(iter_token_chunks(text, max_tokens))
+
+# -----------------------
+# System messages
+# -----------------------
+# Built once at import and shared by reference: read-only mappings keep the
+# bytes of every worker prompt stable across calls (and prompt-cache friendly).
+
+def _system_message(content: str) -> Mapping[str, str]:
+    return MappingProxyType({"role": "system", "content": content})
+
+_PERSONA_SYS: Final[Mapping[str, str]] = _system_message(ML_RESEARCHER_INSTRUCTION)
+
+_TITLE_SYS: Final[Mapping[str, str]] = _system_message(
+    "Write a single H1 blog title (prefix with #). 8–14 words, human and specific to this video. "
+    "Avoid generic phrases like “Insights and Analysis” or “Deep Dive”."
+)
+_INTRO_SYS: Final[Mapping[str, str]] = _system_message(
+    "Write a 150–250-word lede that hooks with a relatable line, frames what the video is about, "
+    "and promises 2–3 concrete things the reader will learn. Use first or second person. "
+    "No corporate phrasing."
+)
+_CONTEXT_SYS: Final[Mapping[str, str]] = _system_message(
+    "Write 120–200 words of context: who’s speaking (use any channel/title cues if present), "
+    "why this topic matters now, and what assumptions the viewer might bring. "
+    "If metadata is limited, say “from the video’s flow, it’s likely…” instead of making hard claims."
+)
+_KEY_POINTS_SYS: Final[Mapping[str, str]] = _system_message(
+    "Write a 220–350-word body section with a subheading (## ...). "
+    "Explain one concrete idea grounded in the transcript. Add your take: when it works, where it fails, "
+    "and one practical step to try this week. Human, not academic."
+)
+_KEY_POINTS_MAP_SYS: Final[Mapping[str, str]] = _system_message(
+    "List the 2–3 most concrete ideas in this part of the transcript, one or two sentences each. "
+    "Keep any examples or numbers the speaker gives."
+)
+_QUOTES_SYS: Final[Mapping[str, str]] = _system_message(
+    "Pull 2–3 meaningful lines (quote or clearly marked paraphrase) from the content. "
+    "For each, add 2–3 sentences of commentary: why it matters, when it breaks, how to apply. "
+    "Avoid generic statements."
+)
+_QUOTES_MAP_SYS: Final[Mapping[str, str]] = _system_message(
+    "Copy the 1–3 most quotable lines from this part of the transcript, verbatim, one per line. "
+    "No commentary."
+)
+_SUMMARY_SYS: Final[Mapping[str, str]] = _system_message(
+    "Write a 150–220-word synthesis that connects themes. No bullet re-lists. "
+    "Make one or two thoughtful connections a practitioner would care about."
+)
+_SUMMARY_MAP_SYS: Final[Mapping[str, str]] = _system_message("Summarize the main ideas in this part of the transcript in 3–4 plain sentences.")
+_COMBINED_SYS: Final[Mapping[str, str]] = _system_message(
+    "Write every section of a blog post about this video in one pass and return a JSON object "
+    "with exactly these string fields:\n"
+    "- title: a single H1 title (prefix with #), 8–14 words, specific to this video\n"
+    "- intro: a 150–250-word lede that hooks, frames the video, and promises 2–3 concrete takeaways\n"
+    "- context: 120–200 words on who is speaking, why the topic matters now, and likely viewer assumptions\n"
+    "- key_points_1: a 220–350-word body section with a ## subheading on one concrete idea\n"
+    "- key_points_2: another 220–350-word body section with a ## subheading on a different idea\n"
+    "- quotes: 2–3 meaningful lines with 2–3 sentences of commentary each\n"
+    "- summary: a 150–220-word synthesis starting with '## The Big Picture'\n"
+    "- what_this_means_for_you: 150–250 words starting with '## What this means for you'\n"
+    "- conclusion: 120–200 words starting with '## Wrapping up', ending with a small CTA\n"
+    "- seo: 'META_DESCRIPTION: \"...\"' (<=160 chars) and 'KEYWORDS: \"k1, k2, ...\"' on two lines\n"
+    "- tags: 'Tags: #tag1 #tag2 ...' with 8–12 ML-relevant hashtags\n"
+    "Use Markdown inside the strings. Do not repeat the same opening across sections."
+)
+_WHAT_THIS_MEANS_SYS: Final[Mapping[str, str]] = _system_message(
+    "Write 150–250 words titled 'What this means for you'. "
+    "Translate 2–3 ideas into actions or checks: what to start, stop, or continue. Make it concrete."
+)
+_CONCLUSION_SYS: Final[Mapping[str, str]] = _system_message(
+    "Write 120–200 words that land one memorable takeaway, acknowledge a trade-off, "
+    "and end with a small CTA (e.g., try X this week). No clichés."
+)
+_SEO_SYS: Final[Mapping[str, str]] = _system_message(
+    "Create SEO metadata for ML readers. "
+    "Meta description <=160 characters, human-sounding. "
+    "Keywords: 6–10 realistic phrases ML folks actually search. "
+    "Format:\nMETA_DESCRIPTION: \"...\"\nKEYWORDS: \"k1, k2, ...\""
+)
+_TAGS_SYS: Final[Mapping[str, str]] = _system_message(
+    "Generate 8–12 ML-relevant hashtags that people actually search. "
+    "Mix popular and specific ones. Format: 'Tags: #tag1 #tag2 ...'"
+)
 
 # -----------------------
 # Base Worker
 # -----------------------
 
+# Upper bound on concurrent per-chunk requests for fan-out workers
+MAX_FANOUT_CHUNKS = 8
+
+# Streamed text is held back until this many characters arrived so that
+# `format_output` can still see (and fix up) the start of the section.
+STREAM_HEAD_CHARS = 32
+
+# After the head, deltas (roughly one token each) are batched so the page
+# redraws once per batch instead of once per token: every piece crosses from
+# the event loop thread to the script thread (web_app.iter_async) and becomes
+# one st.write_stream update.
+STREAM_FLUSH_DELTAS = 32
+
+@dataclass
+class GenerationContext:
+    """
+    One routed payload plus the slices workers take from it. Each slice is
+    computed at most once, however many workers (or retries) ask for it.
+    """
+    text: str
+
+    @classmethod
+    def of(cls, source: Union[str, "GenerationContext"]) -> "GenerationContext":
+        return source if isinstance(source, GenerationContext) else cls(source or "")
+
+    @functools.cached_property
+    def _token_ids(self) -> Optional[List[int]]:
+        # Encoded once; chunks, head and tail all slice the same ids
+        return _encode(self.text)
+
+    @functools.cached_property
+    def _trims(self) -> Dict[int, str]:
+        return {}
+
+    @functools.cached_property
+    def chunks(self) -> List[str]:
+        return list(_chunk_ids(self.text, self._token_ids, CHUNK_TOKENS))
+
+    def head(self, max_tokens: int) -> str:
+        return self._trim(max_tokens)
+
+    def tail(self, max_tokens: int) -> str:
+        return self._trim(-max_tokens)
+
+    def _trim(self, signed_tokens: int) -> str:
+        # Positive keeps the first N tokens, negative the last N
+        if signed_tokens not in self._trims:
+            self._trims[signed_tokens] = _trim_ids(
+                self.text, self._token_ids, abs(signed_tokens), signed_tokens < 0)
+        return self._trims[signed_tokens]
+
+class ChatRequest(NamedTuple):
+    messages: List[Dict]
+    max_tokens: int = 1200
+    temperature: float = 0.8
+    model: str = CHAT_MODEL
+
 class BaseWorker:
+    # The static half of every request, built once per class: the task system
+    # message and a user template whose only variable is the routed excerpt.
+    TASK: ClassVar[Optional[Mapping[str, str]]] = None
+    USER_TEMPLATE: ClassVar[str] = "{content}"
+    # Fan-out workers also set MAP_TASK to map every chunk and reduce the partial notes
+    MAP_TASK: ClassVar[Optional[Mapping[str, str]]] = None
+    FANOUT_TOKENS: ClassVar[Tuple[int, int]] = (200, 400)
+    # Right-size the model per section; override on workers that need more capability
+    MODEL: ClassVar[str] = CHAT_MODEL
+
     def __init__(self, name: str):
         self.name = name  # expected names: 'title', 'intro', etc.
 
-    async def generate(self, transcript: str) -> str:
-        # Call synchronous generation in a thread to keep async compatibility
-        import asyncio
-        return await asyncio.to_thread(self._generate_sync, transcript)
-
-    def _generate_sync(self, transcript: str) -> str:
+    async def generate(self, transcript: Union[str, GenerationContext]) -> str:
+        ctx = GenerationContext.of(transcript)
+        chunks = self._fanout_chunks(ctx)
+        if chunks:
+            out = await self._map_reduce(chunks)
+        else:
+            request = self._build(ctx)
+            out = await call_openai(request.messages, request.max_tokens, request.temperature,
+                                    model=request.model)
+        return self.format_output(out)
+
+    async def generate_stream(self, transcript: Union[str, GenerationContext]) -> AsyncIterator[str]:
+        """
+        Yield this section's text as OpenAI streams it. Fan-out workers only
+        have text once the reduce step is done, so they yield it in one piece.
+        """
+        ctx = GenerationContext.of(transcript)
+        if self._fanout_chunks(ctx):
+            yield await self.generate(ctx)
+            return
+        request = self._build(ctx)
+        head = ""
+        pending: List[str] = []
+        async for piece in stream_openai(request.messages, request.max_tokens, request.temperature,
+                                         request.model):
+            if head is None:
+                pending.append(piece)
+                if len(pending) >= STREAM_FLUSH_DELTAS:
+                    yield "".join(pending)
+                    pending.clear()
+                continue
+            head += piece
+            if len(head) >= STREAM_HEAD_CHARS:
+                yield self.format_output(head.lstrip())
+                head = None
+        if head:
+            yield self.format_output(head.strip())
+        elif pending:
+            yield "".join(pending)
+
+    def batch_request(self, transcript: Union[str, GenerationContext]) -> ChatRequest:
+        """The single request this worker would send, for queueing in a Batch API job."""
+        return self._build(GenerationContext.of(transcript))
+
+    def _build(self, ctx: GenerationContext) -> ChatRequest:
+        return self._request(ctx)._replace(model=self.MODEL)
+
+    def _request(self, ctx: GenerationContext) -> ChatRequest:
         # To be implemented by subclasses
         raise NotImplementedError
 
-    # Helper to build messages with persona
-    def _messages(self, task_instructions: str, user_payload: str) -> List[Dict]:
-        return [
-            persona_system_message(),
-            {"role": "system", "content": task_instructions},
-            {"role": "user", "content": user_payload}
-        ]
+    def format_output(self, out: str) -> str:
+        """
+        Normalize raw model text into this section's Markdown. Applied to direct,
+        fan-out, streamed and combined-request output alike, so it must only
+        prepend (a streamed section passes just its first characters).
+        """
+        return out
+
+    def _fanout_chunks(self, ctx: GenerationContext) -> List[str]:
+        # The orchestrator normally routes a single chunk; fan out only on longer input
+        if not self.MAP_TASK:
+            return []
+        return ctx.chunks if len(ctx.chunks) > 1 else []
+
+    async def _map_reduce(self, chunks: List[str]) -> str:
+        """
+        Send every chunk to OpenAI concurrently with MAP_TASK, then merge the
+        partial notes with one TASK call. Covers the whole transcript instead
+        of a single slice, at roughly the latency of two calls.
+        """
+        map_tokens, reduce_tokens = self.FANOUT_TOKENS
+        chunks = spread(chunks, MAX_FANOUT_CHUNKS)
+        partials = await asyncio.gather(*[
+            call_openai(
+                self._messages(self.MAP_TASK, f"Transcript section {i} of {len(chunks)}:\n\n{chunk}"),
+                max_tokens=map_tokens,
+                model=self.MODEL,
+            )
+            for i, chunk in enumerate(chunks, 1)
+        ])
+        notes = "\n\n---\n\n".join(p for p in partials if p)
+        return await call_openai(
+            self._messages(self.TASK, f"Notes taken from each part of the video:\n\n{notes}"),
+            max_tokens=reduce_tokens,
+            model=self.MODEL,
+        )
+
+    # Helper to build messages with persona. The persona is always its own
+    # system message at index 0 and the worker task is never merged into it,
+    # so every worker sends the same cacheable prefix.
+    def _messages(self, task_message: Mapping[str, str], user_payload: str) -> List[Mapping[str, str]]:
+        return [_PERSONA_SYS, task_message, {"role": "user", "content": user_payload}]
+
+    def _prompt(self, content: str) -> List[Mapping[str, str]]:
+        """Messages for this worker's TASK with `content` substituted into USER_TEMPLATE."""
+        return self._messages(self.TASK, self.USER_TEMPLATE.format(content=content))
+
+# -----------------------
+# Combined Worker
+# -----------------------
+
+class CombinedWorker(BaseWorker):
+    """
+    Writes every section in a single JSON-mode request: one round trip and one
+    upload of the shared prefix instead of one per section. The per-section
+    workers act as thin extractors over its fields (`format_output`) and remain
+    the fallback for anything missing or too thin.
+    """
+    SECTIONS = (
+        "title", "intro", "context", "key_points_1", "key_points_2", "quotes",
+        "summary", "what_this_means_for_you", "conclusion", "seo", "tags",
+    )
+    JSON_FORMAT = {"type": "json_object"}
+    TASK = _COMBINED_SYS
+    USER_TEMPLATE = "Transcript:\n\n{content}"
+
+    def __init__(self):
+        super().__init__("combined")
+
+    def _request(self, ctx: GenerationContext) -> ChatRequest:
+        # Sample across the whole video, not just its opening
+        excerpt = "\n\n[...]\n\n".join(spread(ctx.chunks, 4)) or ctx.text
+        messages = self._prompt(excerpt)
+        return ChatRequest(messages, max_tokens=4000, temperature=0.7)
+
+    async def generate_sections(self, transcript: Union[str, GenerationContext]) -> Dict[str, str]:
+        request = self._build(GenerationContext.of(transcript))
+        raw = await call_openai(request.messages, request.max_tokens, request.temperature, self.JSON_FORMAT,
+                                request.model)
+        data = _loads(raw)
+        return {name: str(data.get(name) or "").strip() for name in self.SECTIONS}
 
 # -----------------------
 # Title Worker
 # -----------------------
 
 class TitleWorker(BaseWorker):
+    TASK = _TITLE_SYS
+    USER_TEMPLATE = "Transcript excerpt:\n\n{content}\n\nNow write the title."
+
     def __init__(self):
         super().__init__("title")
 
-    def _generate_sync(self, transcript: str) -> str:
-        chunks = chunk_text(transcript, 400)
-        first = chunks[0] if chunks else transcript[:1200]
-        task = (
-            "Write a single H1 blog title (prefix with #). 8–14 words, human and specific to this video. "
-            "Avoid generic phrases like “Insights and Analysis” or “Deep Dive”."
-        )
-        messages = self._messages(task, f"Transcript excerpt:\n\n{first}\n\nNow write the title.")
-        out = call_openai(messages, max_tokens=80, temperature=0.7)
+    def _request(self, ctx: GenerationContext) -> ChatRequest:
+        first = ctx.head(530)
+        messages = self._prompt(first)
+        return ChatRequest(messages, max_tokens=80, temperature=0.7)
+
+    def format_output(self, out: str) -> str:
         if not out.startswith("#"):
             out = "# " + out
         return out
@@ -120,95 +769,91 @@ class TitleWorker(BaseWorker):
 # -----------------------
 
 class IntroWorker(BaseWorker):
+    TASK = _INTRO_SYS
+    USER_TEMPLATE = "Use this content to ground your lede:\n\n{content}"
+
     def __init__(self):
         super().__init__("intro")
 
-    def _generate_sync(self, transcript: str) -> str:
-        chunks = chunk_text(transcript, 600)
-        first = chunks if chunks else transcript[:1500]
-        task = (
-            "Write a 150–250-word lede that hooks with a relatable line, frames what the video is about, "
-            "and promises 2–3 concrete things the reader will learn. Use first or second person. "
-            "No corporate phrasing."
-        )
-        messages = self._messages(task, f"Use this content to ground your lede:\n\n{first}")
-        return call_openai(messages, max_tokens=280)
+    def _request(self, ctx: GenerationContext) -> ChatRequest:
+        first = ctx.head(800)
+        messages = self._prompt(first)
+        return ChatRequest(messages, max_tokens=280)
 
 # -----------------------
 # Context Worker (NEW)
 # -----------------------
 
 class ContextWorker(BaseWorker):
+    TASK = _CONTEXT_SYS
+    USER_TEMPLATE = "Ground this context in the following:\n\n{content}"
+
     def __init__(self):
         super().__init__("context")
 
-    def _generate_sync(self, transcript: str) -> str:
-        chunks = chunk_text(transcript, 600)
-        anchor = chunks if chunks else transcript[:1500]
-        task = (
-            "Write 120–200 words of context: who’s speaking (use any channel/title cues if present), "
-            "why this topic matters now, and what assumptions the viewer might bring. "
-            "If metadata is limited, say “from the video’s flow, it’s likely…” instead of making hard claims."
-        )
-        messages = self._messages(task, f"Ground this context in the following:\n\n{anchor}")
-        return call_openai(messages, max_tokens=240)
+    def _request(self, ctx: GenerationContext) -> ChatRequest:
+        anchor = ctx.head(800)
+        messages = self._prompt(anchor)
+        return ChatRequest(messages, max_tokens=240)
 
 # -----------------------
 # Key Points / Body Sections Worker
 # -----------------------
 
 class KeyPointsWorker(BaseWorker):
+    TASK = _KEY_POINTS_SYS
+    USER_TEMPLATE = "Use this section to ground your writing:\n\n{content}"
+    MAP_TASK = _KEY_POINTS_MAP_SYS
+    FANOUT_TOKENS = (200, 420)
+
     def __init__(self):
         super().__init__("key_points")
 
-    def _generate_sync(self, transcript: str) -> str:
+    def _request(self, ctx: GenerationContext) -> ChatRequest:
         # Use middle chunk to avoid repeating intro
-        chunks = chunk_text(transcript, 800)
-        mid = chunks[len(chunks)//2] if chunks else transcript[:1800]
-        task = (
-            "Write a 220–350-word body section with a subheading (## ...). "
-            "Explain one concrete idea grounded in the transcript. Add your take: when it works, where it fails, "
-            "and one practical step to try this week. Human, not academic."
-        )
-        messages = self._messages(task, f"Use this section to ground your writing:\n\n{mid}")
-        return call_openai(messages, max_tokens=420)
+        chunks = ctx.chunks
+        mid = chunks[len(chunks)//2] if chunks else ctx.head(450)
+        messages = self._prompt(mid)
+        return ChatRequest(messages, max_tokens=420)
 
 # -----------------------
 # Quotes Worker
 # -----------------------
 
 class QuotesWorker(BaseWorker):
+    TASK = _QUOTES_SYS
+    USER_TEMPLATE = "Ground in this content:\n\n{content}"
+    MAP_TASK = _QUOTES_MAP_SYS
+    FANOUT_TOKENS = (160, 500)
+
     def __init__(self):
         super().__init__("quotes")
 
-    def _generate_sync(self, transcript: str) -> str:
+    def _request(self, ctx: GenerationContext) -> ChatRequest:
         # Use most-content chunk (rough heuristic: the longest chunk)
-        chunks = chunk_text(transcript, 800)
-        ref = max(chunks, key=len) if chunks else transcript[:2000]
-        task = (
-            "Pull 2–3 meaningful lines (quote or clearly marked paraphrase) from the content. "
-            "For each, add 2–3 sentences of commentary: why it matters, when it breaks, how to apply. "
-            "Avoid generic statements."
-        )
-        messages = self._messages(task, f"Ground in this content:\n\n{ref}")
-        return call_openai(messages, max_tokens=500)
+        ref = max(ctx.chunks, key=len) if ctx.chunks else ctx.head(500)
+        messages = self._prompt(ref)
+        return ChatRequest(messages, max_tokens=500)
 
 # -----------------------
 # Summary Worker
 # -----------------------
 
 class SummaryWorker(BaseWorker):
+    TASK = _SUMMARY_SYS
+    USER_TEMPLATE = "Base your synthesis on:\n\n{content}"
+    MAP_TASK = _SUMMARY_MAP_SYS
+    FANOUT_TOKENS = (160, 280)
+
     def __init__(self):
         super().__init__("summary")
 
-    def _generate_sync(self, transcript: str) -> str:
-        base = transcript[-1800:] if len(transcript) > 2000 else transcript
-        task = (
-            "Write a 150–220-word synthesis that connects themes. No bullet re-lists. "
-            "Make one or two thoughtful connections a practitioner would care about."
-        )
-        messages = self._messages(task, f"Base your synthesis on:\n\n{base}")
-        out = call_openai(messages, max_tokens=280)
+    def _request(self, ctx: GenerationContext) -> ChatRequest:
+        base = ctx.tail(450)
+        messages = self._prompt(base)
+        return ChatRequest(messages, max_tokens=280)
+
+    def format_output(self, out: str) -> str:
         if not out.startswith("##"):
             out = "## The Big Picture\n\n" + out
         return out
@@ -218,17 +863,18 @@ class SummaryWorker(BaseWorker):
 # -----------------------
 
 class WhatThisMeansWorker(BaseWorker):
+    TASK = _WHAT_THIS_MEANS_SYS
+    USER_TEMPLATE = "Base this on:\n\n{content}"
+
     def __init__(self):
         super().__init__("what_this_means_for_you")
 
-    def _generate_sync(self, transcript: str) -> str:
-        tail = transcript[-1500:] if len(transcript) > 1500 else transcript
-        task = (
-            "Write 150–250 words titled 'What this means for you'. "
-            "Translate 2–3 ideas into actions or checks: what to start, stop, or continue. Make it concrete."
-        )
-        messages = self._messages(task, f"Base this on:\n\n{tail}")
-        out = call_openai(messages, max_tokens=260)
+    def _request(self, ctx: GenerationContext) -> ChatRequest:
+        tail = ctx.tail(375)
+        messages = self._prompt(tail)
+        return ChatRequest(messages, max_tokens=260)
+
+    def format_output(self, out: str) -> str:
         if not out.lower().startswith("## what this means"):
             out = "## What this means for you\n\n" + out
         return out
@@ -238,17 +884,18 @@ class WhatThisMeansWorker(BaseWorker):
 # -----------------------
 
 class ConclusionWorker(BaseWorker):
+    TASK = _CONCLUSION_SYS
+    USER_TEMPLATE = "Use this ending context:\n\n{content}"
+
     def __init__(self):
         super().__init__("conclusion")
 
-    def _generate_sync(self, transcript: str) -> str:
-        tail = transcript[-1200:] if len(transcript) > 1400 else transcript
-        task = (
-            "Write 120–200 words that land one memorable takeaway, acknowledge a trade-off, "
-            "and end with a small CTA (e.g., try X this week). No clichés."
-        )
-        messages = self._messages(task, f"Use this ending context:\n\n{tail}")
-        out = call_openai(messages, max_tokens=220)
+    def _request(self, ctx: GenerationContext) -> ChatRequest:
+        tail = ctx.tail(300)
+        messages = self._prompt(tail)
+        return ChatRequest(messages, max_tokens=220)
+
+    def format_output(self, out: str) -> str:
         if not out.startswith("##"):
             out = "## Wrapping up\n\n" + out
         return out
@@ -258,34 +905,32 @@ class ConclusionWorker(BaseWorker):
 # -----------------------
 
 class SEOWorker(BaseWorker):
+    TASK = _SEO_SYS
+    USER_TEMPLATE = "Use this for context:\n\n{content}"
+
     def __init__(self):
         super().__init__("seo")
 
-    def _generate_sync(self, transcript: str) -> str:
-        task = (
-            "Create SEO metadata for ML readers. "
-            "Meta description <=160 characters, human-sounding. "
-            "Keywords: 6–10 realistic phrases ML folks actually search. "
-            "Format:\nMETA_DESCRIPTION: \"...\"\nKEYWORDS: \"k1, k2, ...\""
-        )
-        messages = self._messages(task, f"Use this for context:\n\n{transcript[:1200]}")
-        return call_openai(messages, max_tokens=160, temperature=0.6)
+    def _request(self, ctx: GenerationContext) -> ChatRequest:
+        messages = self._prompt(ctx.head(300))
+        return ChatRequest(messages, max_tokens=160, temperature=0.6)
 
 # -----------------------
 # Tags Worker
 # -----------------------
 
 class TagsWorker(BaseWorker):
+    TASK = _TAGS_SYS
+    USER_TEMPLATE = "Topic context:\n\n{content}"
+
     def __init__(self):
         super().__init__("tags")
 
-    def _generate_sync(self, transcript: str) -> str:
-        task = (
-            "Generate 8–12 ML-relevant hashtags that people actually search. "
-            "Mix popular and specific ones. Format: 'Tags: #tag1 #tag2 ...'"
-        )
-        messages = self._messages(task, f"Topic context:\n\n{transcript[:1000]}")
-        out = call_openai(messages, max_tokens=80, temperature=0.6)
+    def _request(self, ctx: GenerationContext) -> ChatRequest:
+        messages = self._prompt(ctx.head(250))
+        return ChatRequest(messages, max_tokens=80, temperature=0.6)
+
+    def format_output(self, out: str) -> str:
         if not out.lower().startswith("tags:"):
             out = "Tags: " + out
         return out
@@ -0,0 +1,28 @@
+import pathlib
+import sys
+
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT / "src"))
+
+pytest.importorskip("httpx")
+pytest.importorskip("tiktoken")
+
+from workers.implementations import CHUNK_TOKENS, GenerationContext  # noqa: E402
+
+SPECIAL = "<|endoftext|>"
+
+def test_special_token_text_is_chunked_as_plain_text():
+    text = ("so the model emits " + SPECIAL + " and stops there. ") * 400
+    ctx = GenerationContext(text)
+
+    chunks = ctx.chunks
+    assert len(chunks) > 1
+    assert "".join(chunks) == text
+    assert SPECIAL in chunks[0]
+
+    head = ctx.head(CHUNK_TOKENS // 2)
+    assert head and text.startswith(head)
+    tail = ctx.tail(50)
+    assert tail and text.endswith(tail)
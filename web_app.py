@@ -8,15 +8,43 @@ import streamlit as st
 import asyncio
 import sys
 from pathlib import Path
+import hashlib
+import inspect
 import os
-import requests 
+import re
+import httpx
 import time
+import threading
 from datetime import datetime
 import logging
 
 # Add src to path for imports
 sys.path.append(str(Path(__file__).resolve().parent / "src"))
 
+# Imported once per process rather than on every rerun. A broken dependency
+# must not stop the page from loading, so main() reports it in the UI instead.
+try:
+    from orchestrator import BlogOrchestrator, ORCH_VERSION
+    from utils import blog_cache
+    from workers.implementations import CHAT_MODEL, count_words, get_api_key
+    _IMPORT_ERROR = None
+except Exception as e:
+    BlogOrchestrator = None
+    _IMPORT_ERROR = e
+
+try:
+    import mistune
+    HAS_MISTUNE = True
+except ImportError:
+    mistune = None
+    HAS_MISTUNE = False
+
+# Worker and orchestrator diagnostics go through logging; LOG_LEVEL=DEBUG shows per-section detail.
+# An unknown level name falls back to INFO instead of failing the page load.
+_log_level = logging.getLevelName(os.getenv("LOG_LEVEL", "INFO").upper())
+logging.basicConfig(level=_log_level if isinstance(_log_level, int) else logging.INFO,
+                    format="[%(name)s] %(message)s")
+
 # Configure page
 st.set_page_config(
     page_title="YouTube to Blog Generator",
@@ -25,193 +53,396 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Custom CSS
-st.markdown("""
-<style>
+# Custom CSS. Streamlit drops any element a rerun does not emit again, so this
+# is sent on every run (from main); it is minified once here, at import.
+_CSS = """
     .main-header { text-align: center; color: #FF6B6B; font-size: 3rem; margin-bottom: 0.5rem; }
     .sub-header { text-align: center; color: #666; font-size: 1.2rem; margin-bottom: 2rem; }
-    .success-box { background-color: #d4edda; border: 1px solid #c3e6cb; color: #155724; padding: 1rem; border-radius: 0.5rem; margin: 1rem 0; }
-    .error-box { background-color: #f8d7da; border: 1px solid #f5c6cb; color: #721c24; padding: 1rem; border-radius: 0.5rem; margin: 1rem 0; }
-    .warning-box { background-color: #fff3cd; border: 1px solid #ffeaa7; color: #856404; padding: 1rem; border-radius: 0.5rem; margin: 1rem 0; }
-    .blog-container { background-color: #f8f9fa; padding: 2rem; border-radius: 1rem; border-left: 5px solid #FF6B6B; margin: 1rem 0; }
     #MainMenu {visibility: hidden;}
     footer {visibility: hidden;}
     header {visibility: hidden;}
-</style>
-""", unsafe_allow_html=True)
+"""
 
-def main():
-    """Main Streamlit app function - all UI code goes here."""
-    
-    # Header
-    st.markdown('<h1 class="main-header">🎬 → 📝</h1>', unsafe_allow_html=True)
-    st.markdown('<h2 class="main-header">YouTube to Blog Generator</h2>', unsafe_allow_html=True)
-    st.markdown('<p class="sub-header">Transform YouTube videos into comprehensive blog posts - BULLETPROOF version!</p>', unsafe_allow_html=True)
-    
-    # Import orchestrator inside function to avoid module-level import errors
+def _minify_css(css: str) -> str:
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};,])\s*", r"\1", css).strip()
+
+_CSS_MIN = f"<style>{_minify_css(_CSS)}</style>"
+
+# st.html (Streamlit 1.33+) inserts HTML as is; st.markdown first runs it
+# through the frontend's Markdown parser
+def _emit_html(body: str):
+    if hasattr(st, "html"):
+        st.html(body)
+    else:
+        st.markdown(body, unsafe_allow_html=True)
+
+# Watch, short-link, Shorts, live and embed URLs (including m. and the
+# privacy-enhanced embed domain) in one scan; group 1 is the video ID
+_YT_RE = re.compile(
+    r"(?:youtube(?:-nocookie)?\.com/(?:watch\?(?:[^&#]*&)*v=|shorts/|live/|embed/)|youtu\.be/)([A-Za-z0-9_-]{11})"
+)
+
+# Result messages, built once; each run only fills in the values. They go
+# through st.warning/st.success/st.error, whose bodies are Markdown
+# ("  \n" is a line break)
+_EMERGENCY_MSG = (
+    "⚠️ **Limited Processing Mode:**  \n"
+    "We encountered challenges processing this specific video, but generated content based on available information.\n\n"
+    "**For better results, try:**\n"
+    "- A video with clear speech and captions\n"
+    "- Educational or tutorial content\n"
+    "- Videos longer than 5 minutes"
+)
+
+_SUCCESS_TPL = (
+    "✅ **Blog post generated successfully!**  \n"
+    "📊 Word count: {word_count:,} words  \n"
+    "⏱️ Processing time: {processing_time} seconds  \n"
+    "🎯 Success rate: {success_rate} sections  \n"
+    "📅 Generated: {generated}"
+)
+
+_ERROR_TPL = (
+    "❌ **Processing Error:**  \n"
+    "{error}\n\n"
+    "Please try a different video or contact support if this persists."
+)
+
+TEST_VIDEOS = (
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://www.youtube.com/watch?v=8S0FDjFBj8o",
+    "https://www.youtube.com/watch?v=ZmAzIqRSYIM",
+)
+
+_HEADER_HTML = (
+    '<h1 class="main-header">🎬 → 📝</h1>'
+    '<h2 class="main-header">YouTube to Blog Generator</h2>'
+    '<p class="sub-header">Transform YouTube videos into comprehensive blog posts - BULLETPROOF version!</p>'
+)
+
+_SIDEBAR_MD = """
+## ✅ Quality Guarantee
+
+**This system will NEVER completely fail!**
+
+✅ Multiple extraction strategies  
+✅ Safe worker processing  
+✅ Emergency fallback content  
+✅ Bulletproof error handling  
+
+## 🎯 Best Video Types
+
+- 📚 **Educational content**
+- 🎤 **Clear speech/interviews**
+- 📱 **Tutorial videos**
+- 🗣️ **Presentations/talks**
+- 📺 **Documentary content**
+
+## 📄 Display
+"""
+
+@st.cache_resource
+def get_orchestrator():
+    """Build the orchestrator once per process; every rerun and session shares it."""
+    return BlogOrchestrator()
+
+@st.cache_resource
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    One event loop per process, running in a background thread. The pooled
+    HTTP/2 client to OpenAI belongs to its loop, so keeping the loop alive keeps
+    those connections warm from one generation to the next.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="blog-event-loop", daemon=True).start()
+    return loop
+
+def iter_async(agen):
+    """Iterate an async generator on the shared loop from the script thread."""
+    loop = get_event_loop()
     try:
-        from orchestrator import BlogOrchestrator
-        orchestrator = BlogOrchestrator()
-    except Exception as e:
-        st.error(f"❌ Configuration Error: {str(e)}")
-        st.info("Please check that all dependencies are installed and configured correctly.")
-        return  # ✅ CORRECT: return is inside a function
-    
-    # Input section
-    col1, col2, col3 = st.columns([1, 2, 1])
-    
-    with col2:
-        youtube_url = st.text_input(
-            "📎 Enter YouTube URL:",
-            placeholder="https://www.youtube.com/watch?v=...",
-            help="Paste any YouTube video URL here",
-            key="url_input"
-        )
-        
-        generate_clicked = st.button(
-            "🚀 Generate Blog Post", 
-            type="primary",
-            use_container_width=True
-        )
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+
+def _blog_key(url: str) -> str:
+    return blog_cache.make_key(url, ORCH_VERSION)
+
+@st.cache_data(ttl=24 * 3600, max_entries=128, show_spinner=False)
+def load_cached_blog(url: str) -> dict:
+    """
+    Finished post for a canonical URL from the on-disk cache (which survives
+    restarts and is shared by app processes), memoized in memory. Raises
+    KeyError on a miss so that misses are never memoized.
+    """
+    blog_data = blog_cache.lookup(_blog_key(url))
+    if blog_data is None:
+        raise KeyError(url)
+    return blog_data
+
+# mistune converts a post about 4x faster than python-markdown did
+_md = mistune.create_markdown(escape=False, plugins=["strikethrough", "table"]) if HAS_MISTUNE else None
+
+_SIDEBAR_HTML = _md(_SIDEBAR_MD) if HAS_MISTUNE else None
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _md_to_html(content: str) -> str:
+    return _md(content)
+
+FAST_RENDER = "Fast (plain)"
+
+def show_post(content: str):
+    """Render a finished post; its HTML is built once per distinct post and reused on reruns."""
+    # Plain text skips the browser's Markdown/HTML pass, which is what makes
+    # long posts slow to appear
+    if st.session_state.get("render_mode") == FAST_RENDER:
+        st.text(content)
+    elif HAS_MISTUNE:
+        _emit_html(_md_to_html(content))
+    else:
+        st.markdown(content)
+
+def stream_blog(url: str) -> dict:
+    """Write the post to the page as it is generated; returns and persists the post and its stats."""
+    result = {}
+
+    def pieces():
+        for item in iter_async(get_orchestrator().stream_blog_post(url)):
+            if isinstance(item, dict):
+                result.update(item)
+            else:
+                yield item
+
+    preview = st.empty()
+    with preview.container():
+        streamed = st.write_stream(pieces())
+    # The stream is a preview: where a section was rewritten or a block
+    # dropped, swap in the final post
+    if streamed != result["content"]:
+        with preview.container():
+            show_post(result["content"])
+    # The page only needs the post and its stats. The transcript and section
+    # texts, together larger than the post, stay out of the caches and session.
+    post = {"content": result["content"], "stats": result["stats"]}
+    # Posts where some sections failed (and were filled by fallbacks) are shown
+    # but not kept, so the next request for the video tries for a full post
+    done, total = post["stats"]["success_rate"].split("/")
+    if done == total:
+        blog_cache.store(_blog_key(url), post)
+    return post
+
+def _accepts_callable_data() -> bool:
+    # Newer Streamlit can take a zero-argument callable as download data and
+    # only call it when the button is clicked; older versions reject callables
+    try:
+        annotation = inspect.signature(st.download_button).parameters["data"].annotation
+    except (TypeError, ValueError, KeyError):
+        return False
+    return "Callable" in str(annotation)
+
+_LAZY_DOWNLOADS = _accepts_callable_data()
+
+def download_data(content: str):
+    """Markdown for the download button: produced on click where Streamlit supports it."""
+    if _LAZY_DOWNLOADS:
+        return lambda: content.encode("utf-8")
+    return content.encode("utf-8")
+
+def _result_view(blog_data: dict, start_time: float) -> dict:
+    """
+    What is shown under a post, worked out once when it is generated and kept
+    in session state with it; a repeat click reuses it, so the time and word
+    count still describe the original run. One timestamp serves the message
+    and the file name.
+    """
+    stats = blog_data.get("stats", {})
+    # The orchestrator always records word_count; the fallback (evaluated only
+    # when it is missing, unlike a .get default) counts the content itself
+    word_count = stats.get("word_count")
+    if word_count is None:
+        word_count = count_words(blog_data["content"])
+    generated_at = datetime.now()
+    return {
+        "emergency": stats.get("emergency_mode", False),
+        "summary": _SUCCESS_TPL.format(
+            word_count=word_count,
+            processing_time=int(time.time() - start_time),
+            success_rate=stats.get("success_rate", "unknown"),
+            generated=generated_at.strftime("%Y-%m-%d %H:%M:%S"),
+        ),
+        "file_name": f"blog_post_{generated_at.strftime('%Y%m%d_%H%M%S')}.md",
+    }
+
+# st.fragment (st.experimental_fragment before 1.37) reruns only the decorated
+# function on interactions inside it; older Streamlit reruns the whole script.
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda f: f)
+
+@_fragment
+def generate_section():
+    """URL form, spinner and results; clicking Generate reruns only this part."""
+    # In a form, editing the URL doesn't rerun the app; Generate (or Enter) submits it
+    with st.form("url_form"):
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col2:
+            st.text_input(
+                "📎 Enter YouTube URL:",
+                placeholder="https://www.youtube.com/watch?v=...",
+                help="Paste any YouTube video URL here",
+                key="url_input"
+            )
+            generate_clicked = st.form_submit_button(
+                "🚀 Generate Blog Post", 
+                type="primary",
+                use_container_width=True
+            )
+    youtube_url = st.session_state.get("url_input", "")
     
     # Processing section
     if generate_clicked and youtube_url:
-        if not youtube_url.strip():
-            st.error("Please enter a valid YouTube URL")
-            return  # ✅ CORRECT: return is inside a function
-            
-        # Validate URL format
-        if "youtube.com/watch" not in youtube_url and "youtu.be/" not in youtube_url:
-            st.error("Please enter a valid YouTube URL")
-            return  # ✅ CORRECT: return is inside a function
+        # Clicking Generate again on the URL this session just generated shows
+        # that post straight away, without validating or looking anything up
+        key = hashlib.blake2b(youtube_url.encode(), digest_size=8).hexdigest()
+        previous = st.session_state.get("last_blog") if st.session_state.get("last_key") == key else None
+        if previous is None:
+            # Validate URL format and pull out the video ID in one pass
+            match = _YT_RE.search(youtube_url)
+            if not match:
+                st.error("Please enter a valid YouTube URL")
+                return  # ✅ CORRECT: return is inside a function
         
         try:
-            # Show processing status
-            with st.spinner("🔄 Processing your video..."):
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                
-                status_text.text("📥 Initializing bulletproof processor...")
-                progress_bar.progress(10)
-                
-                status_text.text("🎵 Extracting content with multiple fallbacks...")
-                progress_bar.progress(30)
-                
+            # Display the blog post in a bordered container (separate opening and
+            # closing <div> elements never wrapped anything): from cache at once,
+            # otherwise section by section as it is written, so the first lines
+            # show up in seconds
+            with st.container(border=True):
+                st.markdown("## 📖 Generated Blog Post")
                 start_time = time.time()
-                blog_data = asyncio.run(orchestrator.generate_blog_post(youtube_url))
-                end_time = time.time()
-                
-                progress_bar.progress(90)
-                status_text.text("✨ Finalizing content...")
-                progress_bar.progress(100)
-                status_text.empty()
+                if previous is not None:
+                    blog_data = previous
+                    show_post(blog_data["content"])
+                else:
+                    # Canonical URL, so every link form of a video shares cache entries
+                    url = f"https://www.youtube.com/watch?v={match.group(1)}"
+                    try:
+                        blog_data = load_cached_blog(url)
+                        show_post(blog_data["content"])
+                    except KeyError:
+                        with st.spinner("🔄 Processing your video..."):
+                            blog_data = stream_blog(url)
+                    st.session_state["last_key"], st.session_state["last_blog"] = key, blog_data
+                    st.session_state["last_view"] = _result_view(blog_data, start_time)
+            view = st.session_state["last_view"]
             
             # Check if emergency mode was used
-            is_emergency = blog_data.get("stats", {}).get("emergency_mode", False)
-            
-            if is_emergency:
-                st.markdown(f"""
-                <div class="warning-box">
-                    ⚠️ <strong>Limited Processing Mode:</strong><br>
-                    We encountered challenges processing this specific video, but generated content based on available information.<br><br>
-                    <strong>For better results, try:</strong><br>
-                    • A video with clear speech and captions<br>
-                    • Educational or tutorial content<br>
-                    • Videos longer than 5 minutes
-                </div>
-                """, unsafe_allow_html=True)
+            if view["emergency"]:
+                st.warning(_EMERGENCY_MSG)
             
             # Show success message
-            processing_time = int(end_time - start_time)
-            stats = blog_data.get("stats", {})
-            word_count = stats.get("word_count", len(blog_data["content"].split()))
-            success_rate = stats.get("success_rate", "unknown")
-            
-            st.markdown(f"""
-            <div class="success-box">
-                ✅ <strong>Blog post generated successfully!</strong><br>
-                📊 Word count: {word_count:,} words<br>
-                ⏱️ Processing time: {processing_time} seconds<br>
-                🎯 Success rate: {success_rate} sections<br>
-                📅 Generated: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-            </div>
-            """, unsafe_allow_html=True)
-            
-            # Display the blog post
-            st.markdown('<div class="blog-container">', unsafe_allow_html=True)
-            st.markdown("## 📖 Generated Blog Post")
-            st.markdown(blog_data["content"])
-            st.markdown('</div>', unsafe_allow_html=True)
+            st.success(view["summary"])
             
             # Download button
             col1, col2, col3 = st.columns([1, 1, 1])
             with col2:
                 st.download_button(
                     label="📥 Download as Markdown",
-                    data=blog_data["content"],
-                    file_name=f"blog_post_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md",
+                    data=download_data(blog_data["content"]),
+                    file_name=view["file_name"],
                     mime="text/markdown",
                     use_container_width=True
                 )
         
         except Exception as e:
-            st.markdown(f"""
-            <div class="error-box">
-                ❌ <strong>Processing Error:</strong><br>
-                {str(e)}<br><br>
-                Please try a different video or contact support if this persists.
-            </div>
-            """, unsafe_allow_html=True)
+            st.error(_ERROR_TPL.format(error=str(e)))
     
     elif generate_clicked:
         st.error("Please enter a YouTube URL first!")
+
+def _use_test_video():
+    # Runs as the widget's callback, before the rerun the selection triggers, so
+    # the URL box picks the value up on that same run (assigning a widget's key
+    # after it has been drawn is an error in Streamlit)
+    if st.session_state.test_video:
+        st.session_state.url_input = st.session_state.test_video
+
+def developer_tools():
+    """Test videos and the OpenAI connection check, collapsed in the sidebar."""
+    with st.expander("🧪 Developer tools", expanded=False):
+        # One widget for all test videos rather than a button each
+        st.radio(
+            "Test videos",
+            TEST_VIDEOS,
+            index=None,
+            format_func=lambda url: f"Test Video {TEST_VIDEOS.index(url) + 1}",
+            key="test_video",
+            on_change=_use_test_video
+        )
+        
+        if st.button("🧪 Test OpenAI Connection"):
+            with st.spinner("Testing OpenAI API..."):
+                is_working, message = test_openai_connection_sync()
+                if is_working:
+                    st.success(f"✅ {message}")
+                else:
+                    st.error(f"❌ {message}")
+
+def main():
+    """Main Streamlit app function - all UI code goes here."""
+    
+    # Styles and header go out as one element instead of four
+    _emit_html(_CSS_MIN + _HEADER_HTML)
+    
+    # Once a session's check has passed, later reruns skip it (get_orchestrator
+    # only fetches the cached instance by then)
+    if not st.session_state.get("system_ok"):
+        try:
+            if BlogOrchestrator is None:
+                raise _IMPORT_ERROR
+            get_orchestrator()
+        except Exception as e:
+            st.error(f"❌ Configuration Error: {str(e)}")
+            st.info("Please check that all dependencies are installed and configured correctly.")
+            return  # ✅ CORRECT: return is inside a function
+        st.session_state.system_ok = True
+    
+    generate_section()
     
     # Sidebar with information
     with st.sidebar:
-        st.markdown("## ✅ Quality Guarantee")
-        st.markdown("""
-        **This system will NEVER completely fail!**
-        
-        ✅ Multiple extraction strategies  
-        ✅ Safe worker processing  
-        ✅ Emergency fallback content  
-        ✅ Bulletproof error handling  
-        """)
-        
-        st.markdown("## 🎯 Best Video Types")
-        st.markdown("""
-        - 📚 **Educational content**
-        - 🎤 **Clear speech/interviews** 
-        - 📱 **Tutorial videos**
-        - 🗣️ **Presentations/talks**
-        - 📺 **Documentary content**
-        """)
-        
-        st.markdown("## 🧪 Test Videos")
-        test_videos = [
-            "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
-            "https://www.youtube.com/watch?v=8S0FDjFBj8o",
-            "https://www.youtube.com/watch?v=ZmAzIqRSYIM"
-        ]
+        # The static text goes out as one element, pre-rendered at import when
+        # mistune is available
+        if HAS_MISTUNE:
+            _emit_html(_SIDEBAR_HTML)
+        else:
+            st.markdown(_SIDEBAR_MD)
+        st.radio(
+            "Show saved posts as",
+            ("Formatted", FAST_RENDER),
+            key="render_mode",
+            horizontal=True,
+            help="Plain text shows long posts faster"
+        )
         
-        for i, test_url in enumerate(test_videos, 1):
-            if st.button(f"Test Video {i}", key=f"test_{i}"):
-                st.session_state.url_input = test_url
-                st.experimental_rerun()
-                # Add this test function to your web_app.py
-# Replace the test_openai_connection function with this:
-# Replace the test_openai_connection function with this:
+        developer_tools()
+
+@st.cache_resource
+def _openai_http() -> httpx.Client:
+    """Keep-alive HTTP/2 client for the connection test; repeat clicks skip the TLS handshake."""
+    return httpx.Client(base_url="https://api.openai.com/v1", timeout=30.0, http2=True)
+
 def test_openai_connection_sync():
-    """Test OpenAI API connectivity using requests."""
+    """Test OpenAI API connectivity over the shared client, with the key and model the workers use."""
     try:
-        # Get API key
         try:
-            api_key = st.secrets["OPENAI_API_KEY"]
-        except:
-            api_key = os.getenv("OPENAI_API_KEY")
-            
-        if not api_key or not api_key.startswith("sk-"):
-            return False, "OpenAI API key not found or invalid format"
+            api_key = get_api_key()
+        except ValueError as e:
+            return False, str(e)
         
         # Test API call
         headers = {
@@ -220,35 +451,21 @@ def test_openai_connection_sync():
         }
         
         data = {
-            "model": "gpt-3.5-turbo",
+            "model": CHAT_MODEL,
             "messages": [{"role": "user", "content": "Say 'test successful'"}],
             "max_tokens": 10
         }
         
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers=headers,
-            json=data,
-            timeout=30
-        )
+        response = _openai_http().post("/chat/completions", headers=headers, json=data)
         
         if response.status_code == 200:
-            return True, "OpenAI API working perfectly!"
+            return True, f"OpenAI API working perfectly! ({CHAT_MODEL})"
         else:
             return False, f"API Error {response.status_code}: {response.text[:200]}"
             
     except Exception as e:
         return False, f"Connection error: {str(e)}"
 
-# Update the button to use sync function:
-if st.button("🧪 Test OpenAI Connection"):
-    with st.spinner("Testing OpenAI API..."):
-        is_working, message = test_openai_connection_sync()
-        if is_working:
-            st.success(f"✅ {message}")
-        else:
-            st.error(f"❌ {message}")
-
 # ✅ CORRECT: Entry point that calls main function
 if __name__ == "__main__":
     main()